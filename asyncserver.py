@@ -0,0 +1,287 @@
+"""
+Async serving mode on aiohttp.
+
+/upload awaits both model calls on the event loop instead of holding a
+worker thread for them, so one process can keep hundreds of uploads in
+flight. Run with:
+
+    python asyncserver.py
+
+The batch endpoint and the HTML pages are only served by server.py (waitress).
+"""
+import asyncio
+import time
+from datetime import datetime
+import logging
+from aiohttp import web
+from werkzeug.http import parse_etags
+from server import IMPORT_MS, allowed_file, exit_on_sigterm, forecast_etag, readiness, seconds_until_midnight
+from services.species import analyze_image_async
+from services.calibration import calibration_sessions, register_calibration_async
+from services.quality import inspect_image, is_rejected, rejection
+from services.monthlyforecast import generate_monthly_forecast, generate_bulk_forecast
+from services.predictionstore import query_predictions
+from services.storage import warm_up
+from services.backends import close_async_inference_clients
+from services.admission import admission, Deadline, Overloaded, DeadlineExceeded
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_LATENCY, HTTP_REQUESTS, STAGE_LATENCY, render_metrics
+from services.config import MAX_FILE_SIZE, ADMISSION_MAX_WAIT, ASYNC_ADMISSION_LIMITS, UPLOAD_DEADLINE_SECONDS
+
+
+def json_response(data, status=200, headers=None):
+    return web.json_response(data, status=status, headers=headers)
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        # Label by route pattern, not raw path, so the number of series stays bounded
+        resource = request.match_info.route.resource
+        endpoint = resource.canonical if resource is not None else "unmatched"
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+
+
+async def health_check(request):
+    return json_response({
+        "status": "healthy",
+        "service": "takeafish-backend",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def readiness_check(request):
+    status, http_status, sheets = readiness()
+    return json_response({
+        "status": status,
+        "checks": {"sheets": sheets},
+        "startup": {"import_ms": IMPORT_MS},
+        "timestamp": datetime.now().isoformat()
+    }, status=http_status)
+
+
+async def metrics(request):
+    return web.Response(body=render_metrics().encode("utf-8"), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+
+async def admitted(handler, request):
+    """
+    Async counterpart of server.admitted: await handler(request, deadline) within the
+    "upload" stage limit and UPLOAD_DEADLINE_SECONDS. Overload is 429 with Retry-After;
+    past the deadline the handler is cancelled and the response is 504.
+    """
+    deadline = Deadline(UPLOAD_DEADLINE_SECONDS)
+    try:
+        async with admission.limit_async("upload", deadline, max_wait=ADMISSION_MAX_WAIT):
+            return await asyncio.wait_for(handler(request, deadline), deadline.remaining())
+    except Overloaded as e:
+        logging.warning(f"Upload rejected: {e}")
+        await request.release()  # Read the unread body, or the client stalls sending it
+        return json_response({"error": "Server is busy, please retry later"}, status=429,
+                             headers={"Retry-After": str(e.retry_after)})
+    except (DeadlineExceeded, asyncio.TimeoutError) as e:
+        logging.warning(f"Upload cancelled: {e or 'deadline exceeded'}")
+        await request.release()
+        return json_response({"error": "Request timed out"}, status=504)
+
+
+async def read_image_form(request):
+    """
+    Parse the multipart body and validate its "image" file.
+
+    :return: Tuple of (form, filename, image_bytes, None), or (None, None, None, error_response)
+    """
+    size_error = {"error": f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"}
+
+    content_length = request.content_length
+    if content_length is not None and content_length > MAX_FILE_SIZE:
+        logging.warning(f"File size {content_length} exceeds limit of {MAX_FILE_SIZE}")
+        return None, None, None, json_response(size_error, status=400)
+
+    try:
+        form = await request.post()
+    except web.HTTPRequestEntityTooLarge:
+        return None, None, None, json_response(size_error, status=400)
+
+    file = form.get("image")
+    if not isinstance(file, web.FileField):
+        logging.warning("Upload attempted with no image file provided")
+        return None, None, None, json_response({"error": "No Image File Provided"}, status=400)
+
+    if file.filename == '':
+        return None, None, None, json_response({"error": "No Image File Selected"}, status=400)
+
+    if not allowed_file(file.filename):
+        logging.warning(f"Unsupported file type attempted: {file.filename}")
+        return None, None, None, json_response({"error": "Unsupported file type"}, status=400)
+
+    image_bytes = file.file.read()
+    if len(image_bytes) > MAX_FILE_SIZE:
+        logging.warning(f"File size {len(image_bytes)} exceeds limit of {MAX_FILE_SIZE}")
+        return None, None, None, json_response(size_error, status=400)
+    return form, file.filename, image_bytes, None
+
+
+async def upload_image(request):
+    """Admission controlled like server.py's /upload (see admitted)."""
+    return await admitted(process_upload, request)
+
+
+async def process_upload(request, deadline):
+    parse_start = time.perf_counter()
+    try:
+        form, filename, image_bytes, error = await read_image_form(request)
+        if error is not None:
+            return error
+        calibration = None
+        if form.get("calibration_session"):
+            calibration = calibration_sessions.get(form.get("calibration_session"))
+            if calibration is None:
+                logging.warning("Calibration session not found or expired, falling back to coin detection")
+        STAGE_LATENCY.observe(time.perf_counter() - parse_start, stage="request_parse")
+
+        decoded, quality = await asyncio.get_running_loop().run_in_executor(None, inspect_image, image_bytes)
+        if is_rejected(quality):
+            logging.warning(f"Image rejected by quality gate: {filename} {quality['issues']}")
+            return json_response(rejection(quality), status=422)
+
+        processed_result = await analyze_image_async(image_bytes, calibration, decoded, deadline)
+        if "error" in processed_result:
+            return json_response(processed_result, status=500)
+        if quality is not None:
+            processed_result["image_quality"] = quality
+
+        logging.info(f"Image uploaded and processed successfully: {filename} ({len(image_bytes)} bytes)")
+        return json_response(processed_result)
+
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception:
+        logging.exception("Unexpected error during image processing")
+        return json_response({"error": "Internal server error"}, status=500)
+
+
+async def create_calibration(request):
+    return await admitted(process_calibration, request)
+
+
+async def process_calibration(request, deadline):
+    try:
+        form, filename, image_bytes, error = await read_image_form(request)
+        if error is not None:
+            return error
+        session, status = await register_calibration_async(image_bytes, deadline)
+        return json_response(session, status=status)
+
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception:
+        logging.exception("Unexpected error during calibration")
+        return json_response({"error": "Internal server error"}, status=500)
+
+
+async def get_calibration(request):
+    session = calibration_sessions.get(request.match_info["session_id"])
+    if session is None:
+        return json_response({"error": "Calibration session not found or expired"}, status=404)
+    return json_response(session)
+
+
+async def delete_calibration(request):
+    if not calibration_sessions.delete(request.match_info["session_id"]):
+        return json_response({"error": "Calibration session not found or expired"}, status=404)
+    return json_response({"message": "Calibration session deleted"})
+
+
+async def list_predictions(request):
+    try:
+        limit = int(request.query.get("limit", 50))
+        cursor = request.query.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return json_response({"error": "limit and cursor must be integers"}, status=400)
+
+    if not 1 <= limit <= 500:
+        return json_response({"error": "limit must be between 1 and 500"}, status=400)
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, lambda: query_predictions(
+            species=request.query.get("species"),
+            coin_label=request.query.get("coin_label"),
+            start=request.query.get("start"),
+            end=request.query.get("end"),
+            limit=limit,
+            cursor=cursor,
+        ))
+        return json_response(result)
+    except Exception as e:
+        logging.exception("Error in predictions endpoint")
+        return json_response({"error": f"Server error: {str(e)}"}, status=500)
+
+
+async def monthly_forecast(request):
+    try:
+        data = await request.json()
+
+        now = datetime.now()
+        etag = forecast_etag(data, now)
+        cache_headers = {
+            "ETag": f'W/"{etag}"',
+            "Cache-Control": f"private, max-age={seconds_until_midnight(now)}",
+        }
+        if parse_etags(request.headers.get("If-None-Match")).contains_weak(etag):
+            return web.Response(status=304, headers=cache_headers)
+
+        if isinstance(data, dict) and "entries" in data:
+            result = await asyncio.get_running_loop().run_in_executor(None, generate_bulk_forecast, data)
+        else:
+            result = await asyncio.get_running_loop().run_in_executor(None, generate_monthly_forecast, data)
+
+        if "error" in result:
+            return json_response(result, status=400)
+        return json_response(result, headers=cache_headers)
+
+    except Exception as e:
+        logging.exception("Error in monthly forecast endpoint")
+        return json_response({"error": f"Server error: {str(e)}"}, status=500)
+
+
+async def on_startup(app):
+    warm_up()
+
+
+async def on_cleanup(app):
+    await close_async_inference_clients()
+
+
+def create_app():
+    admission.set_limits(ASYNC_ADMISSION_LIMITS)
+    # Room for the multipart framing around a MAX_FILE_SIZE image
+    app = web.Application(middlewares=[metrics_middleware], client_max_size=MAX_FILE_SIZE + 64 * 1024)
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/ready', readiness_check)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_post('/upload', upload_image)
+    app.router.add_post('/calibration', create_calibration)
+    app.router.add_get('/calibration/{session_id}', get_calibration)
+    app.router.add_delete('/calibration/{session_id}', delete_calibration)
+    app.router.add_get('/predictions', list_predictions)
+    app.router.add_post('/monthly-forecast', monthly_forecast)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+if __name__ == "__main__":
+    logging.info(f"App imported in {IMPORT_MS} ms")
+    exit_on_sigterm()  # Until run_app installs its own handler
+    web.run_app(create_app(), host="0.0.0.0", port=8000)
@@ -0,0 +1,77 @@
+"""
+Compare latency of the inference backends on the sample images in uploads/.
+
+The inference cache is bypassed so every call reaches the backend.
+
+    python -m benchmarks.inference_backends --iterations 20
+    python -m benchmarks.inference_backends --backends onnx
+
+Roboflow needs API_KEY/MODEL_ID (and REFERENCE_API_KEY/COIN_MODEL_ID);
+onnx needs MODEL_ID_ONNX_PATH (and COIN_MODEL_ID_ONNX_PATH).
+"""
+import argparse
+import glob
+import json
+import statistics
+import time
+from dotenv import load_dotenv
+from services.backends import get_inference_backend
+from services.utils import prepare_inference_image
+
+load_dotenv()
+
+MODELS = [("API_KEY", "MODEL_ID"), ("REFERENCE_API_KEY", "COIN_MODEL_ID")]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def benchmark_backend(name, images, iterations):
+    backend = get_inference_backend(name)
+    results = {}
+    for api_key_env, model_id_env in MODELS:
+        error = backend.check(api_key_env, model_id_env)
+        if error:
+            results[model_id_env] = {"skipped": error}
+            continue
+
+        # Warm up (client creation / model load) outside the measurement
+        backend.infer(images[0], api_key_env, model_id_env, 0.10)
+
+        timings = []
+        for _ in range(iterations):
+            for image in images:
+                start = time.perf_counter()
+                backend.infer(image, api_key_env, model_id_env, 0.10)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        results[model_id_env] = {
+            "calls": len(timings),
+            "mean_ms": round(statistics.mean(timings), 2),
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "max_ms": round(max(timings), 2),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["roboflow", "onnx"])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--images", default="uploads/*.png")
+    args = parser.parse_args()
+
+    images = [prepare_inference_image(path) for path in sorted(glob.glob(args.images))]
+    if not images:
+        raise SystemExit(f"No images found for {args.images}")
+
+    report = {name: benchmark_backend(name, images, args.iterations) for name in args.backends}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
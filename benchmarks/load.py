@@ -0,0 +1,284 @@
+"""
+End-to-end load benchmark for /upload and /monthly-forecast.
+
+Starts the app on waitress with the inference API and Google Sheets replaced
+by local stand-ins (see benchmarks/standins.py), drives concurrent requests
+using the sample images in uploads/, and writes latency percentiles,
+throughput and error rate to a JSON file so runs can be compared between commits.
+
+    python -m benchmarks.load
+    python -m benchmarks.load --concurrency 16 --requests 400 --inference-latency-ms 500
+    python -m benchmarks.load --scenarios forecast --output baseline.json
+    python -m benchmarks.load --server aiohttp --concurrency 200
+
+Nothing leaves the machine: API keys, model ids, the prediction database and
+the log file are all pointed at stand-ins or temporary paths.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import requests
+from benchmarks.standins import InferenceStandin, SheetStandin, FISH_SPECIES
+from services.config import WAITRESS_THREADS
+
+
+def summarize(latencies_ms, statuses, errors, elapsed_s):
+    total = len(statuses)
+    failed = sum(1 for status in statuses if status is None or status >= 400)
+    latencies = np.array(latencies_ms) if latencies_ms else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    status_counts = {}
+    for status in statuses:
+        key = str(status) if status is not None else "connection_error"
+        status_counts[key] = status_counts.get(key, 0) + 1
+    return {
+        "requests": total,
+        "errors": failed,
+        "error_rate": round(failed / total, 4) if total else None,
+        "duration_s": round(elapsed_s, 3),
+        "throughput_rps": round(total / elapsed_s, 2) if elapsed_s else None,
+        "latency_ms": {
+            "mean": round(float(latencies.mean()), 2),
+            "p50": round(p50, 2),
+            "p95": round(p95, 2),
+            "p99": round(p99, 2),
+            "max": round(float(latencies.max()), 2),
+        },
+        "status_counts": status_counts,
+        "sample_errors": errors[:5],
+    }
+
+
+def run_load(send, total_requests, concurrency):
+    """
+    Call send(session) total_requests times from concurrency threads.
+
+    :return: Summary dict (see summarize)
+    """
+    latencies, statuses, errors = [], [], []
+    lock = threading.Lock()
+    remaining = [total_requests]
+    local = threading.local()
+
+    def worker():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            status, error = None, None
+            try:
+                response = send(session)
+                status = response.status_code
+                if status >= 400:
+                    error = response.text[:200]
+            except Exception as e:
+                error = str(e)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed_ms)
+                statuses.append(status)
+                if error:
+                    errors.append(error)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    return summarize(latencies, statuses, errors, time.perf_counter() - start)
+
+
+def upload_sender(base_url, images):
+    counter = iter(range(1 << 62))
+    lock = threading.Lock()
+
+    def send(session):
+        with lock:
+            name, data = images[next(counter) % len(images)]
+        return session.post(f"{base_url}/upload", files={"image": (name, data, "image/png")}, timeout=120)
+    return send
+
+
+def forecast_sender(base_url):
+    def send(session):
+        species = random.sample(FISH_SPECIES, random.randint(1, len(FISH_SPECIES)))
+        payload = {name: random.randint(0, 720) for name in species}
+        return session.post(f"{base_url}/monthly-forecast", json=payload, timeout=120)
+    return send
+
+
+SCENARIOS = {
+    "upload": lambda base_url, images: upload_sender(base_url, images),
+    "forecast": lambda base_url, images: forecast_sender(base_url),
+}
+
+
+def stage_latencies(metrics_text):
+    """Mean latency per pipeline stage from the /metrics histograms."""
+    sums = dict(re.findall(r'takeafish_stage_duration_seconds_sum\{stage="([^"]+)"\} (\S+)', metrics_text))
+    counts = dict(re.findall(r'takeafish_stage_duration_seconds_count\{stage="([^"]+)"\} (\S+)', metrics_text))
+    return {
+        stage: {"count": int(counts[stage]), "mean_ms": round(float(sums[stage]) / int(counts[stage]) * 1000, 2)}
+        for stage in sorted(sums) if int(counts.get(stage, 0))
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def configure_environment(inference_url, workdir, hedging=False):
+    """Point the app at the stand-ins. Must run before any services module is imported."""
+    os.environ.update({
+        "INFERENCE_HEDGING": "true" if hedging else "false",
+        "INFERENCE_BACKEND": "roboflow",
+        "INFERENCE_API_URL": inference_url,
+        "API_KEY": "standin",
+        "MODEL_ID": "standin-fish/1",
+        "REFERENCE_API_KEY": "standin",
+        "COIN_MODEL_ID": "standin-coin/1",
+        "SHEETS_EXPORT": "true",
+        "PREDICTIONS_DB_PATH": os.path.join(workdir, "predictions.db"),
+        "LOG_FILE": os.path.join(workdir, "app.log"),
+    })
+    os.environ.pop("INFERENCE_CACHE_DIR", None)
+
+
+class AiohttpServer:
+    """asyncserver.create_app() running on its own event loop thread."""
+
+    def __init__(self):
+        from aiohttp import web
+        import asyncserver
+
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(asyncserver.create_app())
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        threading.Thread(target=self.loop.run_forever, name="aiohttp", daemon=True).start()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(timeout=30)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def start_app(sheet, server_mode, threads, use_cache):
+    """Import the app with the stand-ins installed and serve it in a background thread."""
+    from services import storage, utils
+    from services.cache import InferenceCache
+
+    storage._sheet = sheet
+    storage._sheet_status.update({"connected": True, "connect_ms": 0.0, "error": None})
+    if not use_cache:
+        # Sample images repeat, so without this every call after the first is a cache hit
+        utils.inference_cache = InferenceCache(max_entries=0)
+
+    if server_mode == "aiohttp":
+        app_server = AiohttpServer()
+        return app_server, f"http://127.0.0.1:{app_server.port}", storage
+
+    from waitress import create_server
+    import server
+
+    app_server = create_server(server.app, host="127.0.0.1", port=0, threads=threads)
+    threading.Thread(target=app_server.run, name="waitress", daemon=True).start()
+    return app_server, f"http://127.0.0.1:{app_server.effective_port}", storage
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=["upload", "forecast"])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per scenario")
+    parser.add_argument("--server", choices=["waitress", "aiohttp"], default="waitress",
+                        help="waitress runs server.py, aiohttp runs asyncserver.py")
+    parser.add_argument("--threads", type=int, default=WAITRESS_THREADS, help="Waitress worker threads")
+    parser.add_argument("--inference-latency-ms", type=float, default=300)
+    parser.add_argument("--inference-jitter-ms", type=float, default=50)
+    parser.add_argument("--inference-error-rate", type=float, default=0.0)
+    parser.add_argument("--inference-slow-rate", type=float, default=0.0, help="Share of inference calls that take --inference-slow-ms")
+    parser.add_argument("--inference-slow-ms", type=float, default=5000)
+    parser.add_argument("--hedging", action="store_true", help="Enable hedged inference requests (INFERENCE_HEDGING)")
+    parser.add_argument("--fish-per-image", type=int, default=1)
+    parser.add_argument("--sheets-latency-ms", type=float, default=800)
+    parser.add_argument("--sheets-jitter-ms", type=float, default=200)
+    parser.add_argument("--cache", action="store_true", help="Keep the inference result cache enabled")
+    parser.add_argument("--images", default="uploads/*.png")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/load_<commit>_<time>.json)")
+    args = parser.parse_args()
+
+    images = [(os.path.basename(path), open(path, "rb").read()) for path in sorted(glob.glob(args.images))]
+    if "upload" in args.scenarios and not images:
+        raise SystemExit(f"No images found for {args.images}")
+
+    standin = InferenceStandin(args.inference_latency_ms, args.inference_jitter_ms,
+                               args.fish_per_image, args.inference_error_rate,
+                               args.inference_slow_rate, args.inference_slow_ms).start()
+    sheet = SheetStandin(args.sheets_latency_ms, args.sheets_jitter_ms)
+    workdir = tempfile.mkdtemp(prefix="takeafish-load-")
+    configure_environment(standin.url, workdir, args.hedging)
+    app_server, base_url, storage = start_app(sheet, args.server, args.threads, args.cache)
+
+    report = {
+        "benchmark": "load",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "cpu_count": os.cpu_count()},
+        "config": vars(args),
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenarios:
+            send = SCENARIOS[name](base_url, images)
+            if args.warmup:
+                run_load(send, args.warmup, min(args.warmup, args.concurrency))
+            report["scenarios"][name] = run_load(send, args.requests, args.concurrency)
+            print(f"{name}: {json.dumps(report['scenarios'][name]['latency_ms'])}, "
+                  f"{report['scenarios'][name]['throughput_rps']} req/s, "
+                  f"error rate {report['scenarios'][name]['error_rate']}")
+
+        report["stages"] = stage_latencies(requests.get(f"{base_url}/metrics", timeout=10).text)
+        storage.sheets_writer.stop()  # Flush pending rows so the Sheets numbers are complete
+        report["standins"] = {
+            "inference_calls": standin.calls,
+            "sheets_append_calls": sheet.calls,
+            "sheets_rows": sheet.rows,
+        }
+    finally:
+        app_server.close()
+        standin.stop()
+
+    output = args.output or os.path.join(
+        "benchmarks", "results",
+        f"load_{args.server}_{report['commit'] or 'nogit'}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Microbenchmarks for the pure computation run on every request.
+
+Covers estimate_age, measure_fish, convert_bbox_to_cm, calculate_pixels_per_cm,
+the CLASS_CONF_THRESHOLDS filter (filter_predictions), calculate_species_forecast
+and generate_monthly_forecast for 1-1000 detections and 1-100 species, with
+logging disabled and enabled (the app's queue-based JSON logging at INFO).
+
+    python -m benchmarks.micro
+    python -m benchmarks.micro --save-baseline
+    python -m benchmarks.micro --compare benchmarks/baselines/micro.json
+
+Times are per call; "per_item_us" divides by the number of detections/species.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from services.config import GROWTH_PARAMETERS, CLASS_ID_TO_COIN
+from services.logpipeline import setup_logging, stop_logging
+from services.monthlyforecast import calculate_species_forecast, generate_monthly_forecast, _cached_species_forecast
+from services.species import estimate_age, measure_fish
+from services.utils import convert_bbox_to_cm, calculate_pixels_per_cm, filter_predictions
+
+DETECTION_SIZES = [1, 10, 100, 1000]
+SPECIES_SIZES = [1, 10, 100]
+BASELINE_PATH = os.path.join("benchmarks", "baselines", "micro.json")
+
+SPECIES = list(GROWTH_PARAMETERS)
+
+
+def make_predictions(count, rng):
+    return [
+        {
+            "x": rng.uniform(100, 500), "y": rng.uniform(100, 500),
+            "width": rng.uniform(80, 600), "height": rng.uniform(40, 300),
+            "confidence": rng.uniform(0.2, 1.0), "class": rng.choice(SPECIES),
+            "class_id": i % len(SPECIES), "detection_id": f"det-{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def make_coins(count, rng):
+    return [
+        {"width": rng.uniform(30, 80), "class_id": class_id, "confidence": rng.uniform(0.1, 1.0)}
+        for class_id in (rng.choice(list(CLASS_ID_TO_COIN)) for _ in range(count))
+    ]
+
+
+def make_species_map(count, rng):
+    # Keys only need to normalize (upper/strip) to a known species, so pad with spaces to get unique keys
+    return {SPECIES[i % len(SPECIES)] + " " * (i // len(SPECIES)): rng.randint(0, 720) for i in range(count)}
+
+
+def detection_cases(size, rng):
+    predictions = make_predictions(size, rng)
+    coins = make_coins(size, rng)
+    lengths = [(rng.uniform(2, 80), rng.choice(SPECIES)) for _ in range(size)]
+
+    def run_estimate_age():
+        for length_cm, species in lengths:
+            estimate_age(length_cm, species)
+
+    def run_convert_bbox():
+        for prediction in predictions:
+            convert_bbox_to_cm(prediction["width"], prediction["height"], 37.8)
+
+    def run_pixels_per_cm():
+        for coin in coins:
+            calculate_pixels_per_cm(coin, CLASS_ID_TO_COIN[coin["class_id"]], coin["confidence"])
+
+    return {
+        "estimate_age": run_estimate_age,
+        "measure_fish": lambda: measure_fish(predictions, 37.8),
+        "convert_bbox_to_cm": run_convert_bbox,
+        "calculate_pixels_per_cm": run_pixels_per_cm,
+        "filter_predictions": lambda: filter_predictions(predictions, 0.10),
+    }
+
+
+def species_cases(size, rng):
+    species_map = make_species_map(size, rng)
+    entries = list(species_map.items())
+    today = datetime.now()
+
+    def run_species_forecast_cold():
+        _cached_species_forecast.cache_clear()
+        for species, days in entries:
+            calculate_species_forecast(species, days, today)
+
+    def run_species_forecast_cached():
+        for species, days in entries:
+            calculate_species_forecast(species, days, today)
+
+    def run_monthly_forecast():
+        _cached_species_forecast.cache_clear()
+        generate_monthly_forecast(species_map)
+
+    return {
+        "calculate_species_forecast": run_species_forecast_cold,
+        "calculate_species_forecast_cached": run_species_forecast_cached,
+        "generate_monthly_forecast": run_monthly_forecast,
+    }
+
+
+def measure(func, repeat, min_time):
+    """timeit-style: pick a loop count that runs for min_time, then take repeat samples."""
+    func()  # Warm up (imports, caches)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def run_suite(repeat, min_time, seed):
+    results = {}
+    for size in DETECTION_SIZES:
+        for name, func in detection_cases(size, random.Random(seed)).items():
+            results[f"{name}[detections={size}]"] = (func, size)
+    for size in SPECIES_SIZES:
+        for name, func in species_cases(size, random.Random(seed)).items():
+            results[f"{name}[species={size}]"] = (func, size)
+
+    report = {}
+    for key, (func, size) in results.items():
+        samples = measure(func, repeat, min_time)
+        best, median = min(samples) * 1e6, statistics.median(samples) * 1e6
+        report[key] = {"best_us": round(best, 2), "median_us": round(median, 2),
+                       "per_item_us": round(best / size, 3)}
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def git_dirty():
+    """True if tracked files differ from HEAD, so the commit stamp would not match the measured code."""
+    try:
+        return bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                   capture_output=True, text=True, check=True).stdout.strip())
+    except Exception:
+        return None
+
+
+def compare(report, baseline):
+    """Print best-time ratios against a baseline file (<1 is faster)."""
+    print(f"{'case':<60} {'baseline_us':>12} {'now_us':>12} {'ratio':>7}")
+    for mode, cases in report["results"].items():
+        for key, now in cases.items():
+            before = baseline.get("results", {}).get(mode, {}).get(key)
+            if before:
+                ratio = now["best_us"] / before["best_us"] if before["best_us"] else float("nan")
+                print(f"{mode + ' ' + key:<60} {before['best_us']:>12.2f} {now['best_us']:>12.2f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logging", nargs="+", choices=["disabled", "enabled"], default=["disabled", "enabled"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="Seconds per timing sample")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/micro_<commit>_<time>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Also write the results to {BASELINE_PATH}")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+    if args.save_baseline and git_dirty() is not False:
+        parser.error("--save-baseline needs a clean git tree, so the baseline is stamped with the commit it measured")
+
+    log_dir = tempfile.mkdtemp(prefix="takeafish-micro-")
+    setup_logging(os.path.join(log_dir, "app.log"), level="INFO")
+
+    np.seterr(all="ignore")
+    report = {
+        "benchmark": "micro",
+        "commit": git_commit(),
+        "dirty": git_dirty(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "cpu_count": os.cpu_count()},
+        "config": {"repeat": args.repeat, "min_time": args.min_time, "seed": args.seed},
+        "results": {},
+    }
+    for mode in args.logging:
+        logging.disable(logging.CRITICAL if mode == "disabled" else logging.NOTSET)
+        report["results"][mode] = run_suite(args.repeat, args.min_time, args.seed)
+        print(f"logging {mode}: {len(report['results'][mode])} cases")
+    logging.disable(logging.NOTSET)
+    stop_logging()
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"micro_{report['commit'] or 'nogit'}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    outputs = [output] + ([BASELINE_PATH] if args.save_baseline else [])
+    for path in outputs:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compare the waitress (server.py) and aiohttp (asyncserver.py) serving modes
+under the same /upload load. Each mode runs benchmarks.load in its own process.
+
+    python -m benchmarks.serving_modes
+    python -m benchmarks.serving_modes --concurrency 50 200 --requests 1000
+
+The load generator shares a process with the server it measures, so compare
+the modes with each other rather than reading the numbers as absolute capacity.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from benchmarks.load import git_commit
+from services.config import WAITRESS_THREADS
+
+MODES = ["waitress", "aiohttp"]
+
+
+def run_mode(mode, concurrency, args, workdir):
+    output = os.path.join(workdir, f"{mode}_{concurrency}.json")
+    command = [
+        sys.executable, "-m", "benchmarks.load",
+        "--server", mode, "--scenarios", "upload",
+        "--requests", str(args.requests), "--concurrency", str(concurrency),
+        "--threads", str(args.threads),
+        "--inference-latency-ms", str(args.inference_latency_ms),
+        "--inference-jitter-ms", str(args.inference_jitter_ms),
+        "--output", output,
+    ]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(output, "r", encoding="utf-8") as f:
+        return json.load(f)["scenarios"]["upload"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 50, 200])
+    parser.add_argument("--requests", type=int, default=600)
+    parser.add_argument("--threads", type=int, default=WAITRESS_THREADS, help="Waitress worker threads")
+    parser.add_argument("--inference-latency-ms", type=float, default=300)
+    parser.add_argument("--inference-jitter-ms", type=float, default=50)
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/serving_modes_<commit>_<time>.json)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="takeafish-serving-")
+    report = {
+        "benchmark": "serving_modes",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "results": {mode: {} for mode in MODES},
+    }
+
+    print(f"{'mode':<10} {'concurrency':>11} {'req/s':>8} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'errors':>7}")
+    for concurrency in args.concurrency:
+        for mode in MODES:
+            result = run_mode(mode, concurrency, args, workdir)
+            report["results"][mode][str(concurrency)] = result
+            latency = result["latency_ms"]
+            print(f"{mode:<10} {concurrency:>11} {result['throughput_rps']:>8} {latency['p50']:>9} "
+                  f"{latency['p95']:>9} {latency['p99']:>9} {result['error_rate']:>7}")
+
+    output = args.output or os.path.join(
+        "benchmarks", "results",
+        f"serving_modes_{report['commit'] or 'nogit'}_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
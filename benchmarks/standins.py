@@ -0,0 +1,138 @@
+"""
+Local stand-ins for the external services, used by the load benchmarks.
+
+InferenceStandin answers Roboflow-style POST /<model_id> requests with a fixed
+set of detections; SheetStandin replaces the gspread worksheet. Both sleep for
+latency_ms plus normally distributed jitter_ms to mimic the real services.
+InferenceStandin can also inject faults (error_rate) and tail latency
+(slow_rate of requests take slow_ms instead); both can be changed while running.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FISH_SPECIES = ["TILAPIA", "BANGUS", "TULINGAN", "LAPU-LAPU", "ISLAND MACKEREL"]
+
+
+def simulated_delay(latency_ms, jitter_ms):
+    delay = random.gauss(latency_ms, jitter_ms) if jitter_ms else latency_ms
+    if delay > 0:
+        time.sleep(delay / 1000)
+
+
+def fish_predictions(count):
+    return [
+        {
+            "x": 120 + 10 * i, "y": 200, "width": 260 + 5 * i, "height": 110,
+            "confidence": 0.85, "class": FISH_SPECIES[i % len(FISH_SPECIES)],
+            "class_id": i % len(FISH_SPECIES), "detection_id": f"standin-fish-{i}",
+        }
+        for i in range(count)
+    ]
+
+
+def coin_predictions():
+    return [{
+        "x": 500, "y": 400, "width": 46, "height": 46, "confidence": 0.9,
+        "class": "1_PESO", "class_id": 0, "detection_id": "standin-coin",
+    }]
+
+
+class _StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hang up on purpose (timeouts, cancelled hedged requests)
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class InferenceStandin:
+    """
+    Threaded HTTP server in place of detect.roboflow.com.
+
+    Requests whose model id contains "coin" get a coin detection, all others
+    get fish_per_image fish. Point INFERENCE_API_URL at self.url.
+    """
+
+    def __init__(self, latency_ms=300, jitter_ms=50, fish_per_image=1, error_rate=0.0, slow_rate=0.0, slow_ms=5000):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.fish_per_image = fish_per_image
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._server = _StandinServer(("127.0.0.1", 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with standin._lock:
+                    standin.calls += 1
+                if random.random() < standin.slow_rate:
+                    simulated_delay(standin.slow_ms, 0)
+                else:
+                    simulated_delay(standin.latency_ms, standin.jitter_ms)
+
+                if random.random() < standin.error_rate:
+                    self._reply(500, {"message": "Stand-in error"})
+                    return
+
+                predictions = coin_predictions() if "coin" in self.path.lower() \
+                    else fish_predictions(standin.fish_per_image)
+                self._reply(200, {"predictions": predictions, "image": {"width": 640, "height": 640}})
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="inference-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SheetStandin:
+    """In-memory worksheet with the append_rows call used by the Sheets writer."""
+
+    def __init__(self, latency_ms=800, jitter_ms=200):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def append_rows(self, rows, **kwargs):
+        simulated_delay(self.latency_ms, self.jitter_ms)
+        with self._lock:
+            self.calls += 1
+            self.rows += len(rows)
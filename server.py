@@ -1,23 +1,81 @@
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, jsonify
-import os
+import time
+_import_start = time.perf_counter()
+
+from datetime import datetime, timedelta
+import hashlib
+from flask import Flask, Request, Response, g, render_template, request, redirect, jsonify, stream_with_context
+import json
+import atexit
+import signal
+import sys
 from waitress import serve
+from werkzeug.exceptions import RequestEntityTooLarge
 import tempfile
-from services.species import predict_fish_specie, process_prediction
-from services.monthlyforecast import generate_monthly_forecast
+from services.species import analyze_image, analyze_images
+from services.calibration import calibration_sessions, register_calibration
+from services.quality import assess_image, inspect_image, is_rejected, rejection
+from services.monthlyforecast import generate_monthly_forecast, generate_bulk_forecast
+from services.predictionstore import query_predictions
+from services.storage import sheets_status, sheets_writer, warm_up
+from services.admission import admission, Deadline, DeadlineExceeded, Overloaded
+from services.logpipeline import setup_logging, stop_logging
+from services.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_LATENCY, HTTP_REQUESTS, STAGE_LATENCY, render_metrics
 import logging
-from services.config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE
-from werkzeug.datastructures import FileStorage
+from services.config import ALLOWED_EXTENSIONS, MAX_FILE_SIZE, BATCH_MAX_IMAGES
+from services.config import ADMISSION_MAX_WAIT, UPLOAD_DEADLINE_SECONDS, WAITRESS_THREADS
+
+# Time spent importing the app and its services, reported by /ready
+IMPORT_MS = round((time.perf_counter() - _import_start) * 1000, 2)
+
+
+class UploadRequest(Request):
+    """Keep uploads up to MAX_FILE_SIZE in memory; only oversized bodies spill to disk."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=MAX_FILE_SIZE, mode="rb+")
+
 
 app = Flask(__name__)
+app.request_class = UploadRequest
+
 
+# Setup logging: JSON lines written to a rotating app.log by a background thread
+setup_logging()
+
+
+def shutdown():
+    """Flush queued Google Sheets rows, then stop the log pipeline so the flush is still logged."""
+    sheets_writer.stop()
+    stop_logging()
+
+
+# Registered after setup_logging, so it runs before the log pipeline's own exit hook
+atexit.register(shutdown)
+
+
+def exit_on_sigterm():
+    """
+    Render stops the service with SIGTERM, which kills the process without running
+    atexit hooks. Turn it into a normal exit so shutdown() flushes pending rows.
+    """
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Label by route pattern, not raw path, so the number of series stays bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    start = g.get("request_start")
+    if start is not None:
+        HTTP_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+    return response
 
-# Setup logging
-logging.basicConfig(
-    filename="app.log",            # Save logs in app.log file
-    level=logging.INFO,            # Log INFO and above (INFO, WARNING, ERROR, CRITICAL)
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
 
 @app.route('/')
 def index():
@@ -38,70 +96,301 @@ def health_check():
     }), 200
 
 
+def readiness():
+    """
+    Return (status, http_status, sheets_status). Sheets is only an export: while it is
+    still connecting the app is "starting" (503); once a connection attempt failed it
+    is "degraded" but serving (200) while warm_up keeps retrying.
+    """
+    sheets = sheets_status()
+    if not sheets["enabled"] or sheets["connected"]:
+        return "ready", 200, sheets
+    if sheets["error"]:
+        return "degraded", 200, sheets
+    return "starting", 503, sheets
+
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """
+    Readiness check, separate from /health (liveness).
+    Ready once the Sheets export is connected, or when the export is disabled.
+    """
+    status, http_status, sheets = readiness()
+    return jsonify({
+        "status": status,
+        "checks": {"sheets": sheets},
+        "startup": {"import_ms": IMPORT_MS},
+        "timestamp": datetime.now().isoformat()
+    }), http_status
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms and counters in the Prometheus text exposition format."""
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/upload', methods=['POST'])
-def upload_image():
+def admitted(handler):
+    """
+    Run handler(deadline) under admission control: over capacity the request is rejected
+    with 429 and Retry-After, and it runs under UPLOAD_DEADLINE_SECONDS (504 when exceeded).
+    """
+    deadline = Deadline(UPLOAD_DEADLINE_SECONDS)
+    try:
+        with admission.limit("upload", deadline, max_wait=ADMISSION_MAX_WAIT):
+            return handler(deadline)
+    except Overloaded as e:
+        logging.warning(f"Upload rejected: {e}")
+        return jsonify({"error": "Server is busy, please retry later"}), 429, {"Retry-After": str(e.retry_after)}
+    except DeadlineExceeded as e:
+        logging.warning(f"Upload cancelled: {e}")
+        return jsonify({"error": "Request timed out"}), 504
+
+
+def read_image_file():
+    """
+    Validate and read the "image" file of a multipart request.
+
+    :return: Tuple of (file, image_bytes, None), or (None, None, error_response) if invalid
+    """
     if 'image' not in request.files:
         logging.warning("Upload attempted with no image file provided")
-        return jsonify({"error": "No Image File Provided"}), 400
+        return None, None, (jsonify({"error": "No Image File Provided"}), 400)
     
     file = request.files['image']
     if file.filename == '':
-        return jsonify({"error": "No Image File Selected"}), 400
+        return None, None, (jsonify({"error": "No Image File Selected"}), 400)
     
     if not allowed_file(file.filename):
         logging.warning(f"Unsupported file type attempted: {file.filename}")
-        return jsonify({"error": "Unsupported file type"}), 400
+        return None, None, (jsonify({"error": "Unsupported file type"}), 400)
 
     # File size validation
     content_length = request.content_length
     if content_length is not None and content_length > MAX_FILE_SIZE:
         logging.warning(f"File size {content_length} exceeds limit of {MAX_FILE_SIZE}")
-        return jsonify({"error": f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"}), 400
+        return None, None, (jsonify({"error": f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"}), 400)
+
+    # Read the upload once; werkzeug already spills large bodies to disk while parsing
+    image_bytes = file.read()
+    if len(image_bytes) > MAX_FILE_SIZE:
+        logging.warning(f"File size {len(image_bytes)} exceeds limit of {MAX_FILE_SIZE}")
+        return None, None, (jsonify({"error": f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"}), 400)
+    return file, image_bytes, None
+
+
+def get_calibration_session():
+    """The calibration session named by the "calibration_session" form field, if any and still valid."""
+    session_id = request.form.get("calibration_session")
+    if not session_id:
+        return None
+    calibration = calibration_sessions.get(session_id)
+    if calibration is None:
+        logging.warning("Calibration session not found or expired, falling back to coin detection")
+    return calibration
+
+
+@app.route('/upload', methods=['POST'])
+def upload_image():
+    """
+    Admission controlled (see admitted). Images failing the local quality gate are
+    rejected with 422 before any inference call. An optional "calibration_session"
+    form field reuses a registered calibration instead of running coin detection.
+    """
+    return admitted(process_upload)
 
-    temp_file_path = None
 
+def process_upload(deadline):
+    parse_start = time.perf_counter()
     try:
-        # Preserve extension
-        ext = os.path.splitext(file.filename)[1].lower()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as temp_file:
-            file.seek(0)
-            file.save(temp_file.name)
-            file.seek(0)
-            if isinstance(file, FileStorage):
-                file.save(temp_file.name)
-            else:
-                temp_file.write(file.read())
-            temp_file_path = temp_file.name
+        file, image_bytes, error = read_image_file()
+        if error is not None:
+            return error
+        calibration = get_calibration_session()
+        STAGE_LATENCY.observe(time.perf_counter() - parse_start, stage="request_parse")
 
-        result = predict_fish_specie(temp_file_path)
-        if "error" in result:
-            logging.error(f"Prediction failed: {result['error']}")
-            return jsonify(result), 500
+        decoded, quality = inspect_image(image_bytes)
+        if is_rejected(quality):
+            logging.warning(f"Image rejected by quality gate: {file.filename} {quality['issues']}")
+            return jsonify(rejection(quality)), 422
+
+        processed_result = analyze_image(image_bytes, deadline, calibration, decoded)
+        if "error" in processed_result:
+            return jsonify(processed_result), 500
+        if quality is not None:
+            processed_result["image_quality"] = quality
 
-        processed_result = process_prediction(result, temp_file_path)
-        logging.info(f"Image uploaded and processed successfully: {temp_file_path}")
+        logging.info(f"Image uploaded and processed successfully: {file.filename} ({len(image_bytes)} bytes)")
         return jsonify(processed_result), 200
 
+    except (Overloaded, DeadlineExceeded):
+        raise
     except Exception as e:
         logging.exception("Unexpected error during image processing")
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logging.info(f"Temporary file deleted: {temp_file_path}")
-            except Exception as ex:
-                logging.warning(f"Failed to delete temp file: {temp_file_path}. Exception: {ex}")
-
-    finally:
-        # Clean up temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.remove(temp_file_path)
-                logging.info(f"Temporary file deleted: {temp_file_path}")
-            except Exception as ex:
-                logging.warning(f"Failed to delete temp file: {temp_file_path}. Exception: {ex}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/calibration', methods=['POST'])
+def create_calibration():
+    """
+    Register a calibration session from a photo of the reference coin, taken with the
+    same setup (rig, distance) as the uploads that follow. Pass the returned session_id
+    as the "calibration_session" form field of /upload to skip coin detection.
+    """
+    return admitted(process_calibration)
+
+
+def process_calibration(deadline):
+    try:
+        file, image_bytes, error = read_image_file()
+        if error is not None:
+            return error
+        session, status = register_calibration(image_bytes, deadline)
+        return jsonify(session), status
+
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        logging.exception("Unexpected error during calibration")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/calibration/<session_id>', methods=['GET'])
+def get_calibration(session_id):
+    session = calibration_sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Calibration session not found or expired"}), 404
+    return jsonify(session), 200
+
+
+@app.route('/calibration/<session_id>', methods=['DELETE'])
+def delete_calibration(session_id):
+    if not calibration_sessions.delete(session_id):
+        return jsonify({"error": "Calibration session not found or expired"}), 404
+    return jsonify({"message": "Calibration session deleted"}), 200
+
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    Process many images from one multipart request (field name "images").
+    Returns per-image results; with ?stream=1 (or Accept: application/x-ndjson)
+    each result is streamed as an NDJSON line as soon as it finishes.
+    A "calibration_session" form field applies to every image.
+    """
+    # Checked before request.files, which parses and spools the whole body
+    batch_limit = MAX_FILE_SIZE * BATCH_MAX_IMAGES
+    too_large = jsonify({"error": f"Batch size exceeds {batch_limit // (1024 * 1024)}MB limit"}), 400
+    content_length = request.content_length
+    if content_length is not None and content_length > batch_limit:
+        logging.warning(f"Batch size {content_length} exceeds limit of {batch_limit}")
+        return too_large
+
+    # Bodies without a Content-Length (chunked) stop being read past the limit
+    request.max_content_length = batch_limit
+    try:
+        files = request.files.getlist('images')
+    except RequestEntityTooLarge:
+        logging.warning(f"Batch body exceeds limit of {batch_limit}")
+        return too_large
+    if not files:
+        logging.warning("Batch upload attempted with no image files provided")
+        return jsonify({"error": "No Image Files Provided"}), 400
+
+    if len(files) > BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images, maximum is {BATCH_MAX_IMAGES}"}), 400
+
+    # Validate, read and quality-check every file up front; only valid images go to the worker pool
+    results = [None] * len(files)
+    images = []
+    positions = []
+    qualities = []
+    for index, file in enumerate(files):
+        item = {"index": index, "filename": file.filename}
+        if file.filename == '':
+            results[index] = {**item, "status": 400, "result": {"error": "No Image File Selected"}}
+        elif not allowed_file(file.filename):
+            results[index] = {**item, "status": 400, "result": {"error": "Unsupported file type"}}
+        else:
+            image_bytes = file.read()
+            if len(image_bytes) > MAX_FILE_SIZE:
+                results[index] = {**item, "status": 400, "result": {"error": f"File size exceeds {MAX_FILE_SIZE // (1024 * 1024)}MB limit"}}
+            else:
+                # The decoded image is not kept: holding up to BATCH_MAX_IMAGES of them costs too much memory
+                try:
+                    _, quality = inspect_image(image_bytes)
+                except Exception:
+                    logging.exception(f"Quality gate failed for {file.filename}")
+                    quality = assess_image(None)
+                if is_rejected(quality):
+                    results[index] = {**item, "status": 422, "result": rejection(quality)}
+                else:
+                    images.append(image_bytes)
+                    positions.append(index)
+                    qualities.append(quality)
+    calibration = get_calibration_session()
+
+    def run():
+        for index, status, result in analyze_images(images, calibration, UPLOAD_DEADLINE_SECONDS):
+            position = positions[index]
+            if qualities[index] is not None and "error" not in result:
+                result["image_quality"] = qualities[index]
+            results[position] = {
+                "index": position,
+                "filename": files[position].filename,
+                "status": status,
+                "result": result,
+            }
+            yield results[position]
+
+    stream = request.args.get("stream") in ("1", "true") or \
+        request.accept_mimetypes.best == "application/x-ndjson"
+    logging.info(f"Batch upload: {len(files)} files, {len(images)} valid, stream={stream}")
+
+    if stream:
+        def generate():
+            for item in results:
+                if item is not None:
+                    yield json.dumps(item) + "\n"
+            for item in run():
+                yield json.dumps(item) + "\n"
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    for _ in run():
+        pass
+    return jsonify({"results": results}), 200
+
+
+@app.route('/predictions', methods=['GET'])
+def list_predictions():
+    """Paginated, filtered predictions from the local store (newest first)."""
+    try:
+        limit = int(request.args.get("limit", 50))
+        cursor = request.args.get("cursor")
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return jsonify({"error": "limit and cursor must be integers"}), 400
+
+    if not 1 <= limit <= 500:
+        return jsonify({"error": "limit must be between 1 and 500"}), 400
+
+    try:
+        result = query_predictions(
+            species=request.args.get("species"),
+            coin_label=request.args.get("coin_label"),
+            start=request.args.get("start"),
+            end=request.args.get("end"),
+            limit=limit,
+            cursor=cursor,
+        )
+        return jsonify(result), 200
+    except Exception as e:
+        logging.exception("Error in predictions endpoint")
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
 @app.route('/monthly-forecast-page', methods=['GET'])
@@ -109,16 +398,44 @@ def monthly_forecast_page():
     return render_template("monthly_forecast.html")  
      
      
+def forecast_etag(data, now):
+    """
+    Weak ETag for a forecast request. Forecasts depend only on the request body
+    and the current date, so the tag can be checked before computing anything.
+    """
+    payload = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{now.strftime('%Y-%m-%d')}|{payload}".encode("utf-8")).hexdigest()[:32]
+
+
+def seconds_until_midnight(now):
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((midnight - now).total_seconds()))
+
+
 @app.route('/monthly-forecast', methods=['POST'])
 def monthly_forecast():
     try:
         data = request.get_json()
-        result = generate_monthly_forecast(data)
+
+        now = datetime.now()
+        etag = forecast_etag(data, now)
+        cache_headers = {
+            "ETag": f'W/"{etag}"',
+            "Cache-Control": f"private, max-age={seconds_until_midnight(now)}",
+        }
+        if request.if_none_match.contains_weak(etag):
+            return "", 304, cache_headers
+
+        # Bulk mode: {"entries": [{"species": ..., "days_before_maturity": ...}], "horizon_months": ..., "step_months": ...}
+        if isinstance(data, dict) and "entries" in data:
+            result = generate_bulk_forecast(data)
+        else:
+            result = generate_monthly_forecast(data)
         
         if "error" in result:
             return jsonify(result), 400
         else:
-            return jsonify(result), 200
+            return jsonify(result), 200, cache_headers
             
     except Exception as e:
         logging.exception("Error in monthly forecast endpoint")
@@ -126,4 +443,7 @@ def monthly_forecast():
 
 
 if __name__ == "__main__":
-    serve(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    logging.info(f"App imported in {IMPORT_MS} ms")
+    warm_up()
+    exit_on_sigterm()
+    serve(app, host="0.0.0.0", port=8000, threads=WAITRESS_THREADS)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# admission.py
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from services.config import ADMISSION_LIMITS, ADMISSION_MAX_WAITING
+from services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_WAITING, ADMISSION_REJECTED
+
+
+class Overloaded(Exception):
+    """A stage is at its in-flight limit and its wait queue is full (or the wait timed out)."""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"Server busy ({stage}), retry in {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request ran past its deadline."""
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) by which a request must finish."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def check(self, what):
+        if self.expired():
+            raise DeadlineExceeded(f"Deadline exceeded before {what}")
+
+
+class StageLimiter:
+    """
+    At most max_in_flight callers inside the stage; up to max_waiting more may
+    wait for a slot. Anyone beyond that is rejected immediately.
+
+    Threads use acquire()/limit(); coroutines on the async server use
+    acquire_async()/limit_async(), which wait without blocking the loop thread.
+    Both share the same counters, and a released slot goes to a waiting
+    coroutine first.
+    """
+
+    def __init__(self, name, max_in_flight, max_waiting):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.in_flight = 0
+        self.waiting = 0
+        self._average_seconds = None  # EWMA of time spent in the stage, for Retry-After
+        self._condition = threading.Condition()
+        self._async_waiters = deque()  # Futures of waiting coroutines, resolved when handed a slot
+
+    def retry_after(self):
+        """Seconds a rejected client should wait: the time to drain the current queue, 1-60."""
+        average = self._average_seconds or 1.0
+        return min(60, max(1, math.ceil(average * (self.waiting + 1) / self.max_in_flight)))
+
+    def _reject(self, reason):
+        ADMISSION_REJECTED.inc(stage=self.name, reason=reason)
+        if reason == "deadline":
+            raise DeadlineExceeded(f"Deadline exceeded waiting for {self.name}")
+        raise Overloaded(self.name, self.retry_after())
+
+    def _wait_timeout(self, deadline, max_wait):
+        timeouts = [t for t in (max_wait, deadline.remaining() if deadline else None) if t is not None]
+        return min(timeouts) if timeouts else None
+
+    def acquire(self, deadline=None, max_wait=None):
+        with self._condition:
+            if self.in_flight < self.max_in_flight and self.waiting == 0:
+                self.in_flight += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self._reject("queue_full")
+
+            timeout = self._wait_timeout(deadline, max_wait)
+            wait_until = time.monotonic() + timeout if timeout is not None else None
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    left = None if wait_until is None else wait_until - time.monotonic()
+                    if left is not None and left <= 0:
+                        self._reject("deadline" if deadline is not None and deadline.expired() else "wait_timeout")
+                    self._condition.wait(left)
+                self.in_flight += 1
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self, deadline=None, max_wait=None):
+        with self._condition:
+            if self.in_flight < self.max_in_flight and self.waiting == 0:
+                self.in_flight += 1
+                return
+            if self.waiting >= self.max_waiting:
+                self._reject("queue_full")
+            slot = asyncio.get_running_loop().create_future()
+            self._async_waiters.append(slot)
+            self.waiting += 1
+
+        try:
+            await asyncio.wait_for(slot, self._wait_timeout(deadline, max_wait))
+        except BaseException as e:
+            with self._condition:
+                granted = slot not in self._async_waiters
+                if not granted:
+                    self._async_waiters.remove(slot)
+                    self.waiting -= 1
+            if not granted:
+                if isinstance(e, asyncio.TimeoutError):
+                    self._reject("deadline" if deadline is not None and deadline.expired() else "wait_timeout")
+                raise
+            if not isinstance(e, asyncio.TimeoutError):
+                self.release(0.0)  # Cancelled just as the slot was handed over
+                raise
+            # Timed out just as the slot was handed over: keep it
+
+    def release(self, held_seconds):
+        with self._condition:
+            if self._average_seconds is None:
+                self._average_seconds = held_seconds
+            else:
+                self._average_seconds = 0.8 * self._average_seconds + 0.2 * held_seconds
+            if self._async_waiters:
+                # The slot passes to the coroutine as is, so in_flight does not change
+                slot = self._async_waiters.popleft()
+                self.waiting -= 1
+                slot.get_loop().call_soon_threadsafe(_grant, slot)
+            else:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    @contextmanager
+    def limit(self, deadline=None, max_wait=None):
+        self.acquire(deadline, max_wait)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def limit_async(self, deadline=None, max_wait=None):
+        await self.acquire_async(deadline, max_wait)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+
+def _grant(slot):
+    if not slot.done():
+        slot.set_result(None)
+
+
+class AdmissionController:
+    """One StageLimiter per stage ("upload", "inference", "storage")."""
+
+    def __init__(self, limits=ADMISSION_LIMITS, max_waiting=ADMISSION_MAX_WAITING):
+        self.stages = {name: StageLimiter(name, limit, max_waiting) for name, limit in limits.items()}
+        for name, stage in self.stages.items():
+            ADMISSION_IN_FLIGHT.set_function(lambda stage=stage: stage.in_flight, stage=name)
+            ADMISSION_WAITING.set_function(lambda stage=stage: stage.waiting, stage=name)
+
+    def set_limits(self, limits):
+        """Change the in-flight limit of the given stages (the async server admits more)."""
+        for name, limit in limits.items():
+            stage = self.stages[name]
+            with stage._condition:
+                stage.max_in_flight = limit
+                stage._condition.notify_all()
+
+    def limit(self, stage, deadline=None, max_wait=None):
+        """Context manager holding a slot in stage. Raises Overloaded or DeadlineExceeded."""
+        return self.stages[stage].limit(deadline, max_wait)
+
+    def limit_async(self, stage, deadline=None, max_wait=None):
+        """Async context manager version of limit() for coroutines."""
+        return self.stages[stage].limit_async(deadline, max_wait)
+
+
+admission = AdmissionController()
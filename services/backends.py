@@ -0,0 +1,452 @@
+# backends.py
+import os
+import ast
+import asyncio
+import base64
+import threading
+import time
+import uuid
+import logging
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from services.config import INFERENCE_API_URL, INFERENCE_POOL_SIZE, INFERENCE_ASYNC_POOL_SIZE, INFERENCE_INPUT_SIZE
+from services.config import ONNX_IOU_THRESHOLD, ONNX_INTRA_OP_THREADS
+
+
+def scrub_api_key(text):
+    """Mask the api_key query value in text (request errors include the full URL)."""
+    from inference_sdk.http.utils.requests import deduct_api_key_from_string
+
+    return deduct_api_key_from_string(text)
+
+
+def _model_url(api_url, model_id):
+    return f"{api_url.rstrip('/')}/{model_id.strip('/')}"
+
+
+class PooledInferenceClient:
+    """
+    Long-lived client for one Roboflow model.
+
+    Keeps a single requests.Session (keep-alive, pooled connections) that is
+    shared by all request threads. The inference configuration is built once,
+    so nothing on the client is mutated per call. A replaced client is retired:
+    its session is closed once the requests already in flight finish.
+    """
+
+    def __init__(self, api_url, api_key, model_id, threshold):
+        self.api_key = api_key
+        self.model_id = model_id
+        self.threshold = threshold
+        self.url = _model_url(api_url, model_id)
+        # Imported here: inference_sdk pulls in supervision and adds ~1s to app startup
+        from inference_sdk import InferenceConfiguration
+
+        self.params = {"api_key": api_key}
+        self.params.update(
+            InferenceConfiguration(confidence_threshold=threshold).to_legacy_call_parameters()
+        )
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=INFERENCE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._in_flight = 0
+        self._retired = False
+        self._lock = threading.Lock()
+
+    def infer(self, image_bytes, timeout=None):
+        """Send encoded image bytes to the model and return the parsed JSON response."""
+        from inference_sdk.http.utils.requests import api_key_safe_raise_for_status
+
+        payload = base64.b64encode(image_bytes).decode("ascii")
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            try:
+                response = self.session.post(
+                    self.url,
+                    params=self.params,
+                    data=payload,
+                    headers={"Content-Type": "application/x-www-form-urlencoded"},
+                    timeout=timeout,
+                )
+            except requests.RequestException as e:
+                # Same exception type (retries tell transient errors apart by type), without the key
+                raise type(e)(scrub_api_key(str(e)), response=e.response) from None
+            api_key_safe_raise_for_status(response)
+            return response.json()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                idle = self._retired and self._in_flight == 0
+            if idle:
+                self.close()
+
+    def retire(self):
+        """Close the session now if idle, otherwise when the last request in flight finishes."""
+        with self._lock:
+            self._retired = True
+            idle = self._in_flight == 0
+        if idle:
+            self.close()
+
+    def close(self):
+        self.session.close()
+
+    def matches(self, api_url, api_key, model_id):
+        return self.api_key == api_key and self.model_id == model_id and self.url == _model_url(api_url, model_id)
+
+
+_client_registry = {}
+_client_registry_lock = threading.Lock()
+
+
+def get_inference_client(api_key_env, model_id_env, threshold=0.10):
+    """
+    Return the pooled client for (api_key_env, model_id_env, threshold).
+
+    Clients are built once and reused. If the API key, model id or API URL in
+    the environment changed (credential rotation) the client is rebuilt; the
+    old one is retired, so threads still using it can finish their requests.
+    Returns None if the key or model id is missing.
+    """
+    api_key = os.getenv(api_key_env)
+    model_id = os.getenv(model_id_env)
+    if not api_key or not model_id:
+        return None
+
+    api_url = os.getenv("INFERENCE_API_URL", INFERENCE_API_URL)
+    registry_key = (api_key_env, model_id_env, threshold)
+    client = _client_registry.get(registry_key)
+    if client is not None and client.matches(api_url, api_key, model_id):
+        return client
+
+    with _client_registry_lock:
+        client = _client_registry.get(registry_key)
+        if client is not None and client.matches(api_url, api_key, model_id):
+            return client
+
+        if client is not None:
+            logging.info(f"Credentials changed for {api_key_env}/{model_id_env}, rebuilding inference client")
+            client.retire()
+
+        client = PooledInferenceClient(api_url, api_key, model_id, threshold)
+        _client_registry[registry_key] = client
+        logging.info(f"Inference client created for {model_id_env} (threshold={threshold})")
+        return client
+
+
+class AsyncInferenceClient:
+    """
+    aiohttp counterpart of PooledInferenceClient for the async server.
+
+    The session is created on first use, so the client must only be used on
+    the event loop that first called it (get_async_inference_client keys
+    clients by loop).
+    """
+
+    def __init__(self, api_url, api_key, model_id, threshold):
+        self.api_key = api_key
+        self.model_id = model_id
+        self.threshold = threshold
+        self.url = _model_url(api_url, model_id)
+        from inference_sdk import InferenceConfiguration
+
+        # Same query string as the requests client, which sends str() of each value
+        params = {"api_key": api_key}
+        params.update(InferenceConfiguration(confidence_threshold=threshold).to_legacy_call_parameters())
+        self.params = {key: str(value) for key, value in params.items()}
+        self.session = None
+        self._in_flight = 0
+        self._retired = False
+
+    async def infer(self, image_bytes, timeout=None):
+        """Send encoded image bytes to the model and return the parsed JSON response."""
+        import aiohttp  # Imported here so the waitress server never loads it
+        import yarl
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=INFERENCE_ASYNC_POOL_SIZE))
+
+        payload = base64.b64encode(image_bytes).decode("ascii")
+        self._in_flight += 1
+        try:
+            async with self.session.post(
+                self.url,
+                params=self.params,
+                data=payload,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=aiohttp.ClientTimeout(total=timeout) if timeout else None,
+            ) as response:
+                if response.status >= 400:
+                    # ClientResponseError prints the request URL, so build it from one without the key
+                    url = yarl.URL(scrub_api_key(str(response.url)))
+                    request_info = aiohttp.RequestInfo(url, response.method, response.request_info.headers, url)
+                    raise aiohttp.ClientResponseError(
+                        request_info, response.history, status=response.status,
+                        message=response.reason, headers=response.headers,
+                    )
+                return await response.json(content_type=None)
+        finally:
+            self._in_flight -= 1
+            if self._retired and self._in_flight == 0:
+                await self.close()
+
+    def retire(self):
+        """Close the session now if idle, otherwise when the last request in flight finishes."""
+        self._retired = True
+        if self._in_flight == 0:
+            asyncio.ensure_future(self.close())
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    def matches(self, api_url, api_key, model_id):
+        return self.api_key == api_key and self.model_id == model_id and self.url == _model_url(api_url, model_id)
+
+
+_async_client_registry = {}
+
+
+def get_async_inference_client(api_key_env, model_id_env, threshold=0.10):
+    """
+    Async version of get_inference_client for the running event loop.
+    Only called from the loop thread, so no lock is needed.
+    """
+    api_key = os.getenv(api_key_env)
+    model_id = os.getenv(model_id_env)
+    if not api_key or not model_id:
+        return None
+
+    api_url = os.getenv("INFERENCE_API_URL", INFERENCE_API_URL)
+    registry_key = (asyncio.get_running_loop(), api_key_env, model_id_env, threshold)
+    client = _async_client_registry.get(registry_key)
+    if client is not None and client.matches(api_url, api_key, model_id):
+        return client
+
+    if client is not None:
+        logging.info(f"Credentials changed for {api_key_env}/{model_id_env}, rebuilding async inference client")
+        client.retire()
+
+    client = AsyncInferenceClient(api_url, api_key, model_id, threshold)
+    _async_client_registry[registry_key] = client
+    logging.info(f"Async inference client created for {model_id_env} (threshold={threshold})")
+    return client
+
+
+async def close_async_inference_clients():
+    """Close the async clients of the running loop (call on server shutdown)."""
+    loop = asyncio.get_running_loop()
+    for registry_key in [key for key in _async_client_registry if key[0] is loop]:
+        await _async_client_registry.pop(registry_key).close()
+
+
+class InferenceBackend:
+    """
+    Interface for the engine behind run_inference.
+
+    infer() receives an InferenceImage and returns a Roboflow-shaped result
+    ({"image": {...}, "predictions": [{"x", "y", "width", "height",
+    "confidence", "class", "class_id", "detection_id"}, ...]}) in payload
+    pixels. Threshold filtering and rescaling happen in run_inference.
+
+    Remote backends get timeouts, retries and the circuit breaker from
+    services/resilience.py around each infer() call.
+    """
+
+    name = None
+    remote = False
+
+    def check(self, api_key_env, model_id_env):
+        """Return an error message if the model is not configured, else None."""
+        raise NotImplementedError
+
+    def model_key(self, model_id_env):
+        """Identifier of the configured model, used in cache keys."""
+        raise NotImplementedError
+
+    def infer(self, prepared, api_key_env, model_id_env, threshold, timeout=None):
+        """timeout (seconds) bounds remote calls; local engines may ignore it."""
+        raise NotImplementedError
+
+    async def infer_async(self, prepared, api_key_env, model_id_env, threshold, timeout=None):
+        """Awaitable infer(). By default the blocking call runs in the loop's executor."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.infer, prepared, api_key_env, model_id_env, threshold, timeout)
+
+
+class RoboflowBackend(InferenceBackend):
+    """Hosted Roboflow HTTP API through the pooled clients."""
+
+    name = "roboflow"
+    remote = True
+
+    def check(self, api_key_env, model_id_env):
+        if not os.getenv(api_key_env):
+            return f"Walang Key. Check Sa Environment File: {api_key_env}"
+        if not os.getenv(model_id_env):
+            return f"Walang Model ID. Check Sa Environment File: {model_id_env}"
+        return None
+
+    def model_key(self, model_id_env):
+        return os.getenv(model_id_env)
+
+    def infer(self, prepared, api_key_env, model_id_env, threshold, timeout=None):
+        client = get_inference_client(api_key_env, model_id_env, threshold)
+        return client.infer(prepared.payload, timeout)
+
+    async def infer_async(self, prepared, api_key_env, model_id_env, threshold, timeout=None):
+        client = get_async_inference_client(api_key_env, model_id_env, threshold)
+        return await client.infer(prepared.payload, timeout)
+
+
+class OnnxModel:
+    """A YOLOv11 detection model exported to ONNX, run on CPU with onnxruntime."""
+
+    def __init__(self, path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("onnxruntime is required for INFERENCE_BACKEND=onnx (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        if ONNX_INTRA_OP_THREADS:
+            options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+        self.session = ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        self.input_height = height if isinstance(height, int) else INFERENCE_INPUT_SIZE
+        self.input_width = width if isinstance(width, int) else INFERENCE_INPUT_SIZE
+
+        # Ultralytics exports store the class names in the model metadata
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        self.names = ast.literal_eval(names) if names else {}
+
+    def predict(self, image, threshold, iou_threshold=ONNX_IOU_THRESHOLD):
+        """Run detection on a BGR image and return predictions in image pixels."""
+        image_height, image_width = image.shape[:2]
+
+        # Letterbox to the model input size, as done at training time
+        gain = min(self.input_height / image_height, self.input_width / image_width)
+        new_width, new_height = round(image_width * gain), round(image_height * gain)
+        pad_left = (self.input_width - new_width) // 2
+        pad_top = (self.input_height - new_height) // 2
+        canvas = np.full((self.input_height, self.input_width, 3), 114, dtype=np.uint8)
+        canvas[pad_top:pad_top + new_height, pad_left:pad_left + new_width] = cv2.resize(
+            image, (new_width, new_height), interpolation=cv2.INTER_LINEAR
+        )
+        blob = np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+        output = self.session.run(None, {self.input_name: blob})[0][0]
+        # YOLOv11 detection output is (4 + num_classes, num_anchors)
+        if output.shape[0] < output.shape[1]:
+            output = output.T
+
+        class_scores = output[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores >= threshold
+        boxes, scores, class_ids = output[keep, :4], scores[keep], class_ids[keep]
+        if len(scores) == 0:
+            return []
+
+        boxes[:, 0] = (boxes[:, 0] - pad_left) / gain
+        boxes[:, 1] = (boxes[:, 1] - pad_top) / gain
+        boxes[:, 2:4] /= gain
+
+        corner_boxes = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2, boxes[:, 2], boxes[:, 3]])
+        indices = cv2.dnn.NMSBoxesBatched(
+            corner_boxes.tolist(), scores.tolist(), class_ids.tolist(), threshold, iou_threshold
+        )
+
+        predictions = []
+        for i in np.array(indices).flatten():
+            class_id = int(class_ids[i])
+            predictions.append({
+                "x": float(boxes[i, 0]),
+                "y": float(boxes[i, 1]),
+                "width": float(boxes[i, 2]),
+                "height": float(boxes[i, 3]),
+                "confidence": float(scores[i]),
+                "class": str(self.names.get(class_id, class_id)),
+                "class_id": class_id,
+                "detection_id": str(uuid.uuid4()),
+            })
+        return predictions
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    Local CPU engine for exported YOLOv11 weights.
+
+    The model file for a model is read from "<model_id_env>_ONNX_PATH",
+    e.g. MODEL_ID_ONNX_PATH and COIN_MODEL_ID_ONNX_PATH.
+    """
+
+    name = "onnx"
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model_path(self, model_id_env):
+        return os.getenv(f"{model_id_env}_ONNX_PATH")
+
+    def check(self, api_key_env, model_id_env):
+        path = self._model_path(model_id_env)
+        if not path:
+            return f"Walang ONNX Model. Check Sa Environment File: {model_id_env}_ONNX_PATH"
+        if not os.path.exists(path):
+            return f"ONNX model not found: {path}"
+        return None
+
+    def model_key(self, model_id_env):
+        return f"onnx:{self._model_path(model_id_env)}"
+
+    def get_model(self, model_id_env):
+        path = self._model_path(model_id_env)
+        model = self._models.get(path)
+        if model is None:
+            with self._lock:
+                model = self._models.get(path)
+                if model is None:
+                    start = time.perf_counter()
+                    model = OnnxModel(path)
+                    self._models[path] = model
+                    logging.info(f"Loaded ONNX model {path} in {(time.perf_counter() - start) * 1000:.2f} ms")
+        return model
+
+    def infer(self, prepared, api_key_env, model_id_env, threshold, timeout=None):
+        image = cv2.imdecode(np.frombuffer(prepared.payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError("Could not decode image")
+
+        start = time.perf_counter()
+        predictions = self.get_model(model_id_env).predict(image, threshold)
+        return {
+            "time": time.perf_counter() - start,
+            "image": {"width": image.shape[1], "height": image.shape[0]},
+            "predictions": predictions,
+        }
+
+
+BACKENDS = {
+    RoboflowBackend.name: RoboflowBackend(),
+    OnnxBackend.name: OnnxBackend(),
+}
+
+
+def get_inference_backend(name=None):
+    """Return the backend selected by INFERENCE_BACKEND (default "roboflow")."""
+    name = (name or os.getenv("INFERENCE_BACKEND", RoboflowBackend.name)).lower()
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown inference backend: {name}. Available: {list(BACKENDS)}")
+    return backend
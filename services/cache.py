@@ -0,0 +1,213 @@
+# cache.py
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from services.metrics import CACHE_LOOKUPS, CACHE_ENTRIES
+
+
+def make_cache_key(image_bytes, model_id, threshold):
+    """Content-addressed key: hash of the image bytes plus model id and threshold."""
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(f"{digest}|{model_id}|{threshold}".encode("utf-8")).hexdigest()
+
+
+class InferenceCache:
+    """
+    Thread-safe LRU cache with TTL for inference results.
+
+    Results live in memory (bounded by max_entries). If disk_dir is set, each
+    entry is also written there as JSON so the cache survives restarts. The
+    disk tier holds at most max_disk_entries files: once it grows past that,
+    expired files and then the oldest ones are pruned.
+
+    A named cache exports its lookups and entry counts on /metrics.
+    """
+
+    def __init__(self, max_entries=256, ttl_seconds=3600, disk_dir=None, max_disk_entries=10000, name=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_entries = 0
+        self._prune_lock = threading.Lock()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self.prune_disk()
+
+        if name:
+            CACHE_ENTRIES.set_function(lambda: len(self._entries), cache=name, tier="memory")
+            if disk_dir:
+                CACHE_ENTRIES.set_function(lambda: self._disk_entries, cache=name, tier="disk")
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on miss/expiry."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    self._count("hit")
+                    return copy.deepcopy(value)
+                del self._entries[key]
+
+        value = self._read_disk(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                self._count("miss")
+                return None
+            self._store(key, value, now)
+            self.hits += 1
+        self._count("disk_hit")
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        now = time.time()
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._store(key, value, now)
+        self._write_disk(key, value)
+
+    def delete(self, key):
+        """Drop an entry from memory and disk. Returns True if it was cached in memory and not expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            found = entry is not None and now - entry[0] <= self.ttl_seconds
+        if self.disk_dir:
+            self._remove_disk(self._disk_path(key))
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_entries": self._disk_entries,
+                "max_disk_entries": self.max_disk_entries if self.disk_dir else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def prune_disk(self):
+        """
+        Remove expired disk entries, then the oldest ones until the tier is
+        back under max_disk_entries (with some headroom, so pruning does not
+        run on every write). Returns the number of files removed.
+        """
+        if not self.disk_dir or not self._prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            now = time.time()
+            target = int(self.max_disk_entries * 0.9)
+            entries = []
+            removed = 0
+            with os.scandir(self.disk_dir) as it:
+                for item in it:
+                    if not item.name.endswith(".json"):
+                        continue
+                    try:
+                        mtime = item.stat().st_mtime
+                    except FileNotFoundError:
+                        continue
+                    if now - mtime > self.ttl_seconds:
+                        removed += self._remove_disk(item.path, counted=False)
+                    else:
+                        entries.append((mtime, item.path))
+            if len(entries) > target:
+                entries.sort()
+                for _, path in entries[:len(entries) - target]:
+                    removed += self._remove_disk(path, counted=False)
+                entries = entries[len(entries) - target:]
+            self._disk_entries = len(entries)
+            if removed:
+                logging.info(f"Pruned {removed} inference cache entries from {self.disk_dir}")
+            return removed
+        except Exception as e:
+            logging.warning(f"Failed to prune inference cache directory {self.disk_dir}: {e}")
+            return 0
+        finally:
+            self._prune_lock.release()
+
+    def _count(self, result):
+        if self.name:
+            CACHE_LOOKUPS.inc(cache=self.name, result=result)
+
+    def _store(self, key, value, stored_at):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if now - os.path.getmtime(path) > self.ttl_seconds:
+                self._remove_disk(path)
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Failed to read inference cache entry {path}: {e}")
+            return None
+
+    def _write_disk(self, key, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            is_new = not os.path.exists(path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning(f"Failed to write inference cache entry {path}: {e}")
+            return
+        if is_new:
+            with self._lock:
+                self._disk_entries += 1
+        if self._disk_entries > self.max_disk_entries:
+            self.prune_disk()
+
+    def _remove_disk(self, path, counted=True):
+        """Delete a disk entry. Returns 1 if a file was removed, else 0."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logging.warning(f"Failed to remove inference cache entry {path}: {e}")
+            return 0
+        if counted:
+            with self._lock:
+                self._disk_entries = max(self._disk_entries - 1, 0)
+        return 1
@@ -0,0 +1,70 @@
+# calibration.py
+import logging
+import secrets
+import time
+from datetime import datetime
+from services.cache import InferenceCache
+from services.config import CALIBRATION_SESSION_TTL, CALIBRATION_MAX_SESSIONS
+from services.species import detect_reference_coin, detect_reference_coin_async
+
+
+class CalibrationSessions:
+    """
+    Coin calibrations registered once per device session (same rig, same distance).
+
+    Uploads that pass the session id reuse its pixels_per_cm and skip the coin
+    model. Sessions expire ttl_seconds after registration, and the least
+    recently used ones are evicted beyond max_entries. Held in memory only.
+    """
+
+    def __init__(self, max_entries=CALIBRATION_MAX_SESSIONS, ttl_seconds=CALIBRATION_SESSION_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._sessions = InferenceCache(max_entries=max_entries, ttl_seconds=ttl_seconds, name="calibration")
+
+    def create(self, coin_result):
+        """Store a successful coin calibration (calculate_pixels_per_cm result) and return the session."""
+        now = time.time()
+        session = {
+            "session_id": secrets.token_urlsafe(16),
+            "calibration": coin_result,
+            "created_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "expires_at": datetime.fromtimestamp(now + self.ttl_seconds).isoformat(timespec="seconds"),
+        }
+        self._sessions.set(session["session_id"], session)
+        logging.info(f"Calibration session created: {coin_result.get('coin_label')}, "
+                     f"pixels_per_cm={coin_result.get('pixels_per_cm'):.2f}")
+        return session
+
+    def get(self, session_id):
+        """Return the session, or None if it is unknown or expired."""
+        if not session_id:
+            return None
+        return self._sessions.get(session_id)
+
+    def delete(self, session_id):
+        return self._sessions.delete(session_id)
+
+
+calibration_sessions = CalibrationSessions()
+
+
+def _register(coin_result):
+    if "error" in coin_result:
+        return coin_result, 500
+    if coin_result.get("pixels_per_cm", 0) <= 0:
+        return {"error": "No usable coin detected for calibration", "coin_result": coin_result}, 422
+    return calibration_sessions.create(coin_result), 201
+
+
+def register_calibration(image, deadline=None):
+    """
+    Run coin detection on a calibration photo and open a session for it.
+
+    :return: Tuple of (session or error dict, HTTP status)
+    """
+    return _register(detect_reference_coin(image, deadline))
+
+
+async def register_calibration_async(image, deadline=None):
+    """Awaitable register_calibration for the async server."""
+    return _register(await detect_reference_coin_async(image, deadline))
@@ -1,4 +1,6 @@
 # config.py
+import math
+
 GROWTH_PARAMETERS = {
   "ISLAND MACKEREL":{"L_inf":30.1, "K":2.00, "t0":0.91},
   "LAPU-LAPU":{"L_inf":30.9, "K":0.51, "t0":0.47},
@@ -7,6 +9,22 @@ GROWTH_PARAMETERS = {
   "TILAPIA":{"L_inf":44.2, "K":0.43, "t0":0.333},
 }
 
+MATURITY_THRESHOLD = 0.8  # Fraction of L_inf at which a fish counts as mature
+
+# Per-species constants derived once from GROWTH_PARAMETERS (used by the batched age engine)
+GROWTH_CONSTANTS = {
+    species: {
+        **params,
+        "maturity_length": params["L_inf"] * MATURITY_THRESHOLD,
+        "maturity_age_days": ((math.log((params["L_inf"] - params["L_inf"] * MATURITY_THRESHOLD) / params["L_inf"]) / -params["K"]) + params["t0"]) * 365,
+    }
+    for species, params in GROWTH_PARAMETERS.items()
+}
+
+FORECAST_MAX_ENTRIES = 10000         # Entries per bulk /monthly-forecast request
+FORECAST_MAX_HORIZON_MONTHS = 120
+FORECAST_CACHE_SIZE = 1024           # Memoized (species, days, date) forecasts
+
 SPECIES_SIZE_THRESHOLDS = {
     "TILAPIA": {"SMALL": 40, "MEDIUM": 70, "CATCHABLE": 100},
     "BANGUS": {"SMALL": 35, "MEDIUM": 65, "CATCHABLE": 100},
@@ -35,6 +53,82 @@ ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png'}
 
 MAX_FILE_SIZE = 3 * 1024 * 1024  # 3MB
 
+# Local image quality gate, run before any remote inference (services/quality.py)
+IMAGE_QUALITY_MODE = "reject"       # reject (422), flag (process and report) or off
+IMAGE_QUALITY_SIZE = 512            # Blur/exposure are measured on a grayscale preview with its longest side 1-2x this
+IMAGE_MIN_DIMENSION = 128           # Shortest side in pixels
+IMAGE_BLUR_THRESHOLD = 15.0         # Laplacian variance of the preview; below this the image is too blurry
+IMAGE_MIN_CONTRAST = 8.0            # Gray level standard deviation; below this the image is blank
+IMAGE_MIN_BRIGHTNESS = 25           # Mean gray level (0-255)
+IMAGE_MAX_BRIGHTNESS = 250          # Sample photos on white backgrounds average ~240
+IMAGE_MAX_CLIPPED_FRACTION = 0.95   # Share of pixels at or below 10 / at or above 245
+
+BATCH_MAX_IMAGES = 20   # Images accepted per /upload/batch request
+BATCH_MAX_WORKERS = 4   # Images processed in parallel across all batch requests
+
+WAITRESS_THREADS = 32   # Must cover ADMISSION_LIMITS["upload"] + ADMISSION_MAX_WAITING plus headroom to send 429s
+
+# Admission control: requests allowed inside each stage at once
+ADMISSION_LIMITS = {
+    "upload": 8,      # Whole /upload requests
+    "inference": 16,  # Inference API calls (two per upload)
+    "storage": 4,     # Local prediction store writes
+}
+# The async server holds no thread per upload, so it admits more: up to the connection
+# pools of the two model clients (INFERENCE_ASYNC_POOL_SIZE each)
+ASYNC_ADMISSION_LIMITS = {
+    "upload": 200,
+    "inference": 400,
+}
+ADMISSION_MAX_WAITING = 16     # Callers that may queue for a stage before being rejected
+ADMISSION_MAX_WAIT = 5.0       # Seconds an upload may wait for a slot before a 429
+UPLOAD_DEADLINE_SECONDS = 30   # Total time budget for one /upload
+
+
+INFERENCE_API_URL = "https://detect.roboflow.com"
+
+INFERENCE_POOL_SIZE = 8  # Keep-alive connections per model client
+INFERENCE_ASYNC_POOL_SIZE = 200  # Connections per model client in the async server
+
+# Resilience around remote inference calls (services/resilience.py)
+INFERENCE_TIMEOUT = 10.0             # Seconds per attempt
+INFERENCE_MAX_TRIES = 3              # Attempts per call, including the first
+INFERENCE_RETRY_BACKOFF = 0.25       # Seconds before the first retry (exponential, full jitter)
+INFERENCE_RETRY_RATIO = 0.2          # Retries + hedges allowed per call, on average
+INFERENCE_RETRY_RESERVE = 10         # Retry tokens kept for low traffic (and the bucket cap)
+INFERENCE_CIRCUIT_FAILURES = 5       # Consecutive failures that open the circuit
+INFERENCE_CIRCUIT_RESET = 30.0       # Seconds the circuit stays open before a probe call
+INFERENCE_HEDGE_PERCENTILE = 95      # Hedge once an attempt is slower than this latency percentile
+INFERENCE_HEDGE_MIN_SAMPLES = 20     # Latency samples needed before hedging starts
+INFERENCE_HEDGE_WINDOW = 200         # Recent latencies kept per model
+INFERENCE_HEDGE_WORKERS = 32         # Threads running hedged attempts (waitress server)
+
+INFERENCE_INPUT_SIZE = 640  # Models were trained on 640x640 inputs
+INFERENCE_JPEG_QUALITY = 90
+
+ONNX_IOU_THRESHOLD = 0.45   # NMS overlap for the local ONNX backend
+ONNX_INTRA_OP_THREADS = 0   # 0 lets onnxruntime pick
+
+INFERENCE_CACHE_MAX_ENTRIES = 256
+INFERENCE_CACHE_TTL = 60 * 60  # 1 hour
+INFERENCE_CACHE_MAX_DISK_ENTRIES = 10000  # Files kept in INFERENCE_CACHE_DIR; oldest are pruned beyond this
+
+CALIBRATION_SESSION_TTL = 4 * 60 * 60   # Registered coin calibrations are reused for 4 hours
+CALIBRATION_MAX_SESSIONS = 10000
+CALIBRATION_ASPECT_TOLERANCE = 0.01     # Uploads resized from the calibration photo's frame reuse it, within 1%
+
+
+SHEETS_QUEUE_SIZE = 1000     # Pending predictions before new ones are dropped
+SHEETS_BATCH_SIZE = 50       # Rows per append_rows call
+SHEETS_FLUSH_INTERVAL = 2.0  # Seconds before a partial batch is written
+SHEETS_MAX_RETRIES = 5
+SHEETS_WARM_UP_MAX_DELAY = 300  # Longest wait (seconds) between retries of a failed Sheets connection
+
+
+LOG_QUEUE_SIZE = 10000             # Records waiting for the log writer before new ones are dropped
+LOG_MAX_BYTES = 10 * 1024 * 1024   # Rotate app.log at 10MB
+LOG_BACKUP_COUNT = 5
+
 
 
 
@@ -4,12 +4,20 @@ import smtplib
 import gspread
 import json
 import csv
+import gzip
+import io
+import zipfile
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
 from oauth2client.service_account import ServiceAccountCredentials
 import logging
+import threading
+import time
+import numpy as np
+from gspread.utils import numericise_all
 
 # Load .env file
 load_dotenv()
@@ -19,140 +27,321 @@ EMAIL_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 GOOGLE_CREDS_JSON = os.getenv("GOOGLE_CREDS_JSON")
 REPORT_RECIPIENT = os.getenv("REPORT_RECIPIENT")
 
-if not GOOGLE_CREDS_JSON:
-    raise ValueError("❌ Missing Google credentials JSON in environment")
+REPORT_CSV_COMPRESSION = os.getenv("REPORT_CSV_COMPRESSION", "none")  # none, zip or gzip
 
-try:
-    decoded_json = base64.b64decode(GOOGLE_CREDS_JSON).decode("utf-8")
-    creds_dict = json.loads(decoded_json)
-except Exception:
-    creds_dict = json.loads(GOOGLE_CREDS_JSON)
+REPORT_WINDOW_DAYS = 7
+REPORT_HEADERS = ["INTERFERENCE ID", "Species", "Confidence", "Width (px)", "Height (px)",
+                  "Width (cm)", "Height (cm)", "Length (cm)", "Area (cm²)",
+                  "Days Before Maturity", "Pixels per cm", "Coin Label", "Coin Confidence", "Date/Time"]
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-client = gspread.authorize(creds)
-sheet = client.open("Fish Predictions").sheet1
+
+# Opened on first use so importing this module does not wait on Google
+_sheet = None
+_sheet_lock = threading.Lock()
+
+
+def get_sheet():
+    """Authorize and open the "Fish Predictions" sheet once, then reuse it."""
+    global _sheet
+    if _sheet is not None:
+        return _sheet
+
+    with _sheet_lock:
+        if _sheet is None:
+            if not GOOGLE_CREDS_JSON:
+                raise ValueError("❌ Missing Google credentials JSON in environment")
+
+            start = time.perf_counter()
+            try:
+                decoded_json = base64.b64decode(GOOGLE_CREDS_JSON).decode("utf-8")
+                creds_dict = json.loads(decoded_json)
+            except Exception:
+                creds_dict = json.loads(GOOGLE_CREDS_JSON)
+
+            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+            client = gspread.authorize(creds)
+            _sheet = client.open("Fish Predictions").sheet1
+            logging.info(f"Connected to Google Sheets in {(time.perf_counter() - start) * 1000:.2f} ms")
+    return _sheet
+
+
+def _pad(row, width):
+    return list(row) + [""] * (width - len(row))
+
+
+def parse_timestamps(stamps):
+    """Parse "YYYY-MM-DD HH:MM:SS" strings in bulk; invalid entries become NaT."""
+    valid = [isinstance(s, str) and len(s) == 19 and s[10] == " " for s in stamps]
+    candidates = np.array([s if ok else "NaT" for s, ok in zip(stamps, valid)], dtype=object)
+    try:
+        return np.array(candidates, dtype="datetime64[s]")
+    except ValueError:
+        # Fall back to per-row parsing to isolate the bad values
+        parsed = []
+        for s in candidates:
+            try:
+                parsed.append(np.datetime64(datetime.strptime(s, DATE_FORMAT)) if s != "NaT" else np.datetime64("NaT"))
+            except ValueError:
+                parsed.append(np.datetime64("NaT"))
+        return np.array(parsed, dtype="datetime64[s]")
 
 
 def get_recent_data():
-    """Fetch fish predictions from the last 24 hours."""
+    """
+    Fetch fish predictions from the last REPORT_WINDOW_DAYS days.
+
+    send_report clears the sheet after each report, so one read of the whole
+    sheet only returns the rows added since the previous run.
+    """
     try:
-        data = sheet.get_all_records()
+        values = get_sheet().get_all_values()
     except Exception as e:
         logging.error(f"Failed to fetch Google Sheet data: {e}")
         return []
+    if not values:
+        return []
 
-    one_day_ago = datetime.now() - timedelta(days=7)
-    recent_data = []
-    for row in data:
-        try:
-            dt = datetime.strptime(row["Date/Time"], "%Y-%m-%d %H:%M:%S")
-            if dt >= one_day_ago:
-                recent_data.append(row)
-        except (ValueError, KeyError):
-            logging.warning(f"Skipping row due to missing or invalid Date/Time: {row}")
-    return recent_data
-
-
-def build_csv_file(recent_data):
-    """Generate a daily CSV report and return the filename."""
-    folder = "reports"  
-    os.makedirs(folder, exist_ok=True)  
-
-    filename = os.path.join(folder, f"daily_report_{datetime.now().strftime('%Y%m%d')}.csv")
-    headers = ["INTERFERENCE ID", "Species", "Confidence", "Width (px)", "Height (px)", 
-               "Width (cm)", "Height (cm)", "Length (cm)", "Area (cm²)", 
-               "Days Before Maturity", "Pixels per cm", "Coin Label", "Coin Confidence", "Date/Time"]
-
-    with open(filename, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
-        writer.writeheader()
-        for row in recent_data:
-            writer.writerow({
-                "INTERFERENCE ID": row.get("INTERFERENCE ID", ""),
-                "Species": row.get("Species", ""),
-                "Confidence": row.get("Confidence", ""),
-                "Width (px)": row.get("Width (px)", ""),
-                "Height (px)": row.get("Height (px)", ""),
-                "Width (cm)": row.get("Width (cm)", ""),
-                "Height (cm)": row.get("Height (cm)", ""),
-                "Length (cm)": row.get("Length (cm)", ""),
-                "Area (cm²)": row.get("Area (cm²)", ""),
-                "Days Before Maturity": row.get("Days Before Maturity", ""),
-                "Pixels per cm": row.get("Pixels per cm", ""),
-                "Coin Label": row.get("Coin Label", ""),
-                "Coin Confidence": row.get("Coin Confidence", ""),
-                "Date/Time": row.get("Date/Time", "")
-            })
-
-    return filename
+    # Same shape and value conversion as sheet.get_all_records()
+    header = values[0]
+    records = [dict(zip(header, numericise_all(_pad(row, len(header)), False, ""))) for row in values[1:]]
 
+    cutoff = np.datetime64(datetime.now() - timedelta(days=REPORT_WINDOW_DAYS), "us")
+    timestamps = parse_timestamps([row.get("Date/Time") for row in records])
+    is_valid = ~np.isnat(timestamps)
+    keep = is_valid & (timestamps.astype("datetime64[us]") >= cutoff)
 
-def build_email_content(recent_data):
-    total_fish = len(recent_data)
-    species_count = {}
+    for index in np.flatnonzero(~is_valid).tolist():
+        logging.warning(f"Skipping row due to missing or invalid Date/Time: {records[index]}")
+
+    return [records[index] for index in np.flatnonzero(keep).tolist()]
+
+
+def build_csv_attachment(recent_data, compression=None):
+    """
+    Stream the report rows into an in-memory CSV attachment.
+
+    Rows are written straight through the compressor, so only the compressed
+    bytes are held in memory and nothing touches the filesystem.
+
+    :param compression: "none", "zip" or "gzip" (defaults to REPORT_CSV_COMPRESSION)
+    :return: Tuple of (attachment_filename, attachment_bytes)
+    """
+    compression = (compression or REPORT_CSV_COMPRESSION).lower()
+    csv_name = f"daily_report_{datetime.now().strftime('%Y%m%d')}.csv"
+    buffer = io.BytesIO()
+
+    if compression == "zip":
+        archive = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+        raw = archive.open(csv_name, "w")
+        filename = f"{csv_name}.zip"
+    elif compression == "gzip":
+        archive = None
+        raw = gzip.GzipFile(filename=csv_name, mode="wb", fileobj=buffer)
+        filename = f"{csv_name}.gz"
+    else:
+        archive = None
+        raw = buffer
+        filename = csv_name
+
+    text = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=REPORT_HEADERS)
+    writer.writeheader()
     for row in recent_data:
-        species = row.get("Species", "Unknown")
-        species_count[species] = species_count.get(species, 0) + 1
+        writer.writerow({header: row.get(header, "") for header in REPORT_HEADERS})
+    text.flush()
+
+    if raw is not buffer:
+        text.close()  # Closes the compressed stream and writes its trailer
+        if archive is not None:
+            archive.close()
+    else:
+        text.detach()
+
+    return filename, buffer.getvalue()
+
+
+MATURITY_BUCKETS = ["Mature", "1-90 days", "91-180 days", "181-365 days", "Over 365 days", "Unknown"]
+MATURITY_EDGES = np.array([0, 90, 180, 365])  # Upper bound (inclusive) of each bucket but the last
+LENGTH_PERCENTILES = [25, 50, 75]
+CONFIDENCE_PERCENTILES = [10, 50, 90]
+REPORT_STAT_COLUMNS = ["Species", "Coin Label", "Length (cm)", "Confidence", "Days Before Maturity"]
+_NUMERIC_TYPES = {int, float}  # Exact types, so bools and numeric-looking text are excluded
+
+
+def _numeric_column(values):
+    """Float array of a report column; blanks and text become NaN."""
+    return np.fromiter((value if value.__class__ in _NUMERIC_TYPES else np.nan for value in values),
+                       dtype=float, count=len(values))
+
+
+def _factorize(values, default):
+    """Integer codes for each value plus the list of distinct labels, in first-seen order."""
+    codes = {}
+    index = np.fromiter((codes.setdefault(str(value or default), len(codes)) for value in values),
+                        dtype=np.intp, count=len(values))
+    return index, list(codes)
+
+
+def _percentiles(values, percentiles):
+    values = values[~np.isnan(values)]
+    if not values.size:
+        return [None] * len(percentiles)
+    return np.round(np.percentile(values, percentiles), 2).tolist()
+
+
+def build_report_stats(recent_data):
+    """
+    Columnar aggregation of the report rows.
+
+    The records are turned into NumPy columns once; per-species percentiles,
+    maturity histograms and coin vs default calibration counts are then
+    computed on those arrays.
+
+    :return: Dict with total, calibration and per-species stats (sorted by count, descending)
+    """
+    start = time.perf_counter()
+    columns = [[row.get(key) for row in recent_data] for key in REPORT_STAT_COLUMNS]
+    species_index, names = _factorize(columns[0], "Unknown")
+    used_coin = np.fromiter((str(label or "Default") != "Default" for label in columns[1]),
+                            dtype=bool, count=len(columns[1]))
+    lengths, confidences, days = (_numeric_column(values) for values in columns[2:])
+    counts = np.bincount(species_index, minlength=len(names))
+
+    # Bucket per row, then one bincount over (species, bucket) pairs gives every histogram
+    buckets = np.where(np.isnan(days), len(MATURITY_BUCKETS) - 1,
+                       np.searchsorted(MATURITY_EDGES, np.nan_to_num(days), side="left"))
+    histograms = np.bincount(species_index * len(MATURITY_BUCKETS) + buckets,
+                             minlength=len(names) * len(MATURITY_BUCKETS)).reshape(len(names), len(MATURITY_BUCKETS))
+    coin_counts = np.bincount(species_index, weights=used_coin, minlength=len(names)).astype(int)
+
+    # Group rows by species once so each group's values are a contiguous slice
+    order = np.argsort(species_index, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+    sorted_lengths, sorted_confidences = lengths[order], confidences[order]
+
+    species_stats = []
+    for i, name in enumerate(names):
+        group = slice(bounds[i], bounds[i + 1])
+        species_stats.append({
+            "species": name,
+            "count": int(counts[i]),
+            "length_cm": dict(zip(LENGTH_PERCENTILES, _percentiles(sorted_lengths[group], LENGTH_PERCENTILES))),
+            "confidence": dict(zip(CONFIDENCE_PERCENTILES, _percentiles(sorted_confidences[group], CONFIDENCE_PERCENTILES))),
+            "maturity": dict(zip(MATURITY_BUCKETS, histograms[i].tolist())),
+            "coin_calibrated": int(coin_counts[i]),
+        })
+    species_stats.sort(key=lambda item: -item["count"])
+
+    total = len(recent_data)
+    coin_total = int(used_coin.sum())
+    stats = {
+        "total": total,
+        "calibration": {
+            "coin": coin_total,
+            "default": total - coin_total,
+            "coin_ratio": round(coin_total / total, 4) if total else None,
+        },
+        "species": species_stats,
+    }
+    logging.info(f"Report stats for {total} rows computed in {round((time.perf_counter() - start) * 1000, 2)} ms")
+    return stats
+
+
+def _format_range(values, keys, digits=2):
+    low, mid, high = (values[key] for key in keys)
+    if mid is None:
+        return "-"
+    return f"{mid:.{digits}f} ({low:.{digits}f} - {high:.{digits}f})"
+
+
+def build_email_content(recent_data):
+    stats = build_report_stats(recent_data)
+    empty_row = "<tr><td colspan='{}' style='text-align:center;color:#777;'>No data recorded this day</td></tr>"
 
     species_rows = "".join(
-        f"<tr><td>{species}</td><td style='text-align:right;'>{count}</td></tr>"
-        for species, count in species_count.items()
-    ) or "<tr><td colspan='2' style='text-align:center;color:#777;'>No data recorded this day</td></tr>"
+        f"<tr><td>{item['species']}</td><td style='text-align:right;'>{item['count']}</td></tr>"
+        for item in stats["species"]
+    ) or empty_row.format(2)
+
+    species_stats_rows = "".join(
+        f"<tr><td>{item['species']}</td>"
+        f"<td>{_format_range(item['length_cm'], LENGTH_PERCENTILES)}</td>"
+        f"<td>{_format_range(item['confidence'], CONFIDENCE_PERCENTILES)}</td>"
+        f"<td style='text-align:right;'>{item['coin_calibrated'] / item['count']:.0%}</td></tr>"
+        for item in stats["species"]
+    ) or empty_row.format(4)
+
+    maturity_header = "".join(f"<th>{bucket}</th>" for bucket in MATURITY_BUCKETS)
+    maturity_rows = "".join(
+        f"<tr><td>{item['species']}</td>"
+        + "".join(f"<td style='text-align:right;'>{item['maturity'][bucket]}</td>" for bucket in MATURITY_BUCKETS)
+        + "</tr>"
+        for item in stats["species"]
+    ) or empty_row.format(len(MATURITY_BUCKETS) + 1)
+
+    calibration = stats["calibration"]
+    calibration_summary = (
+        f"Coin calibrated: {calibration['coin']} ({calibration['coin_ratio']:.0%}) &middot; "
+        f"Default calibration: {calibration['default']}"
+        if stats["total"] else "No calibration data"
+    )
 
     with open("templates/email_template.html", "r", encoding="utf-8") as f:
         html_template = f.read()
 
-    return html_template.replace("{{total_fish}}", str(total_fish)) \
+    return html_template.replace("{{total_fish}}", str(stats["total"])) \
                         .replace("{{species_rows}}", species_rows) \
+                        .replace("{{species_stats_rows}}", species_stats_rows) \
+                        .replace("{{maturity_header}}", maturity_header) \
+                        .replace("{{maturity_rows}}", maturity_rows) \
+                        .replace("{{calibration_summary}}", calibration_summary) \
                         .replace("{{generated_at}}", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
 
 
 def send_report():
-    """Send daily fish detection report via email and delete CSV after use."""
+    """Send daily fish detection report via email with the CSV attached from memory."""
     recent_data = get_recent_data()
     if not recent_data:
         logging.info("No recent data to report.")
         return
 
-    csv_file = build_csv_file(recent_data)
+    attachment_name, attachment_bytes = build_csv_attachment(recent_data)
     html_content = build_email_content(recent_data)
 
+    msg = MIMEMultipart()
+    msg["From"] = EMAIL_ADDRESS
+    msg["To"] = REPORT_RECIPIENT
+    msg["Subject"] = "Daily Fish Detection Report"
+    msg.attach(MIMEText(html_content, "html"))
+
+    # Attach CSV report (built in memory)
+    part = MIMEApplication(attachment_bytes, Name=attachment_name)
+    part["Content-Disposition"] = f'attachment; filename="{attachment_name}"'
+    msg.attach(part)
+
     try:
-        msg = MIMEMultipart()
-        msg["From"] = EMAIL_ADDRESS
-        msg["To"] = REPORT_RECIPIENT
-        msg["Subject"] = "Daily Fish Detection Report"
-        msg.attach(MIMEText(html_content, "html"))
-
-        # Attach CSV file
-        with open(csv_file, "rb") as f:
-            from email.mime.application import MIMEApplication
-            part = MIMEApplication(f.read(), Name=os.path.basename(csv_file))
-        part["Content-Disposition"] = f'attachment; filename="{os.path.basename(csv_file)}"'
-        msg.attach(part)
-
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.sendmail(EMAIL_ADDRESS, REPORT_RECIPIENT, msg.as_string())
-
-        logging.info("Daily report email sent successfully via SSL!")
-    except smtplib.SMTPNotSupportedError:
-        with smtplib.SMTP("smtp.gmail.com", 587) as smtp:
-            smtp.starttls()
-            smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-            smtp.sendmail(EMAIL_ADDRESS, REPORT_RECIPIENT, msg.as_string())
-        logging.info("Daily report email sent successfully via STARTTLS!")
+        try:
+            with smtplib.SMTP_SSL("smtp.gmail.com", 465) as smtp:
+                smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+                smtp.sendmail(EMAIL_ADDRESS, REPORT_RECIPIENT, msg.as_string())
+            logging.info("Daily report email sent successfully via SSL!")
+        except smtplib.SMTPNotSupportedError:
+            with smtplib.SMTP("smtp.gmail.com", 587) as smtp:
+                smtp.starttls()
+                smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+                smtp.sendmail(EMAIL_ADDRESS, REPORT_RECIPIENT, msg.as_string())
+            logging.info("Daily report email sent successfully via STARTTLS!")
     except Exception as e:
-        logging.error(f"Failed to send daily report email: {e}")
-
-    # Delete local file
-    os.remove(csv_file)
-    logging.info(f"Deleted local file {csv_file}")
+        # Keep the rows so the next run reports them
+        logging.error(f"Failed to send daily report email, Google Sheet left as is: {e}")
+        return
 
     # Clear the sheet and reset headers
+    sheet = get_sheet()
     sheet.clear()
-    sheet.append_row(["INTERFERENCE ID", "Species", "Confidence", "Width (px)", "Height (px)", "Width (cm)", "Height (cm)", "Length (cm)", "Area (cm²)", "Days Before Maturity", "Pixels per cm", "Coin Label", "Coin Confidence", "Date/Time"])
+    sheet.append_row(REPORT_HEADERS)
     logging.info("Google Sheet cleared and headers restored.")
 
 
@@ -0,0 +1,124 @@
+# logpipeline.py
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+from services.config import LOG_QUEUE_SIZE, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from services.metrics import LOG_RECORDS_DROPPED
+
+load_dotenv()
+
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# Full result dicts are only logged through log_payload, at this level and sample rate
+LOG_PAYLOAD_LEVEL = os.getenv("LOG_PAYLOAD_LEVEL", "INFO").upper()
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.05"))
+
+payload_logger = logging.getLogger("payload")
+
+# Standard LogRecord attributes; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line. Fields passed with extra= are included as-is."""
+
+    def format(self, record):
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hand records to the listener thread untouched.
+
+    The stock QueueHandler formats the message in the calling thread; here
+    formatting and file I/O both happen in the listener. When the queue is
+    full the record is dropped and counted instead of blocking the request.
+    """
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging(log_file=None, level=None):
+    """
+    Route all logging through a bounded queue to a background thread that
+    writes JSON lines to a rotating log file. Safe to call more than once.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _listener
+
+        file_handler = RotatingFileHandler(
+            log_file or LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        file_handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(NonBlockingQueueHandler(log_queue))
+        root.setLevel(level or LOG_LEVEL)
+        payload_logger.setLevel(LOG_PAYLOAD_LEVEL)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        return _listener
+
+
+def stop_logging():
+    """Write out queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def log_payload(message, payload, level=logging.INFO):
+    """
+    Log a large payload (e.g. a full prediction result) as a structured field.
+
+    Skipped without any formatting unless the payload logger is enabled for
+    level, and then only for LOG_PAYLOAD_SAMPLE_RATE of the calls. The payload
+    is copied so later changes by the caller do not race the writer thread.
+    """
+    if not payload_logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    payload_logger.log(level, message, extra={"payload": copy.deepcopy(payload)}, stacklevel=2)
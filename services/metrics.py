@@ -0,0 +1,253 @@
+# metrics.py
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers fast local stages up to slow remote inference calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, one series per label combination."""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that can go up and down. set_function reads it at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, func, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._functions[key] = func
+
+    def render(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for key, func in functions:
+            try:
+                value = func()
+            except Exception:
+                continue
+            with self._lock:
+                self._values[key] = value
+        return super().render()
+
+
+class Histogram(_Metric):
+    """Cumulative latency histogram in seconds, one series per label combination."""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = [(key, list(series["counts"]), series["sum"], series["count"])
+                     for key, series in sorted(self._values.items())]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All registered metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "takeafish_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ["stage"],
+))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "takeafish_stage_errors_total",
+    "Errors per pipeline stage.",
+    ["stage"],
+))
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "takeafish_http_requests_total",
+    "HTTP requests by endpoint, method and status.",
+    ["endpoint", "method", "status"],
+))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "takeafish_http_request_duration_seconds",
+    "End-to-end HTTP request latency.",
+    ["endpoint", "method"],
+))
+PREDICTIONS = REGISTRY.register(Counter(
+    "takeafish_predictions_total",
+    "Detected fish by species.",
+    ["species"],
+))
+LOG_RECORDS_DROPPED = REGISTRY.register(Counter(
+    "takeafish_log_records_dropped_total",
+    "Log records dropped because the log queue was full.",
+))
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "takeafish_admission_in_flight",
+    "Requests currently inside each admission stage.",
+    ["stage"],
+))
+ADMISSION_WAITING = REGISTRY.register(Gauge(
+    "takeafish_admission_waiting",
+    "Requests waiting for a slot in each admission stage.",
+    ["stage"],
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "takeafish_admission_rejected_total",
+    "Requests rejected by admission control, by stage and reason.",
+    ["stage", "reason"],
+))
+INFERENCE_RETRIES = REGISTRY.register(Counter(
+    "takeafish_inference_retries_total",
+    "Inference attempts retried after a transient failure, by model.",
+    ["model"],
+))
+INFERENCE_HEDGES = REGISTRY.register(Counter(
+    "takeafish_inference_hedges_total",
+    "Hedged (duplicate) inference requests fired, by model and which request answered first.",
+    ["model", "winner"],
+))
+INFERENCE_CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "takeafish_inference_circuit_state",
+    "Inference circuit breaker state by model (0 closed, 1 open, 2 half-open).",
+    ["model"],
+))
+INFERENCE_SHORT_CIRCUITED = REGISTRY.register(Counter(
+    "takeafish_inference_short_circuited_total",
+    "Inference calls failed fast because the circuit was open, by model.",
+    ["model"],
+))
+IMAGE_QUALITY_ISSUES = REGISTRY.register(Counter(
+    "takeafish_image_quality_issues_total",
+    "Images flagged by the local quality gate, by issue.",
+    ["issue"],
+))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "takeafish_cache_lookups_total",
+    "Cache lookups by cache and result (hit, disk_hit or miss).",
+    ["cache", "result"],
+))
+CACHE_ENTRIES = REGISTRY.register(Gauge(
+    "takeafish_cache_entries",
+    "Entries currently held by each cache tier.",
+    ["cache", "tier"],
+))
+SHEETS_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "takeafish_sheets_queue_depth",
+    "Queued predictions (row batches) waiting for the Google Sheets writer.",
+))
+
+
+def render_metrics():
+    return REGISTRY.render()
@@ -1,11 +1,21 @@
 from dotenv import load_dotenv
 import logging
 import math
-from services.config import  GROWTH_PARAMETERS, SPECIES_SIZE_THRESHOLDS
+import threading
+from functools import lru_cache
+import numpy as np
+from services.config import  GROWTH_CONSTANTS, SPECIES_SIZE_THRESHOLDS
+from services.config import FORECAST_MAX_ENTRIES, FORECAST_MAX_HORIZON_MONTHS, FORECAST_CACHE_SIZE
+from services.logpipeline import log_payload
 load_dotenv()  # Load environment variables
 from datetime import datetime, timedelta
 
 
+DEFAULT_SIZE_THRESHOLDS = {"SMALL": 40, "MEDIUM": 70, "CATCHABLE": 100}
+
+STAGE_CLASSES = np.array(["SMALL", "MEDIUM", "CATCHABLE"])
+
+
 def calculate_age_from_length(length_cm, L_inf, K, t0):
     """Calculate age from length (reverse Von Bertalanffy)"""
     if length_cm >= L_inf:
@@ -25,12 +35,10 @@ def age_to_length(age_years, L_inf, K, t0):
 def get_size_classification(length_cm, L_inf, species=None):
     """Get size classification with optional species-specific thresholds"""
     percentage = (length_cm / L_inf) * 100
-    
+
     # Use species-specific thresholds if available
-    thresholds = SPECIES_SIZE_THRESHOLDS.get(species, {
-        "SMALL": 40, "MEDIUM": 70, "CATCHABLE": 100
-    })
-    
+    thresholds = SPECIES_SIZE_THRESHOLDS.get(species, DEFAULT_SIZE_THRESHOLDS)
+
     if percentage < thresholds["SMALL"]:
         return {"class": "SMALL", "percentage": round(percentage, 2), "description": "Juvenile, not for harvest"}
     elif percentage < thresholds["MEDIUM"]:
@@ -39,116 +47,260 @@ def get_size_classification(length_cm, L_inf, species=None):
         return {"class": "CATCHABLE", "percentage": round(percentage, 2), "description": "Mature, suitable for harvest"}
 
 
-def calculate_species_forecast(species, days_before_maturity, current_date):
-    """Calculate monthly growth forecast for a species using UTILS.py parameters"""
+# Per-species forecast constants: (L_inf, K, t0, maturity_length, maturity_age_years).
+# Taken from GROWTH_CONSTANTS so the growth math lives in one place.
+FORECAST_CONSTANTS = {
+    species: (
+        constants["L_inf"], constants["K"], constants["t0"],
+        constants["maturity_length"], constants["maturity_age_days"] / 365,
+    )
+    for species, constants in GROWTH_CONSTANTS.items()
+}
 
-    if days_before_maturity < 0:
-        logging.warning(f"Negative days before maturity for {species}: {days_before_maturity}")
-        return {"error": f"Invalid days before maturity for {species}: {days_before_maturity}"}
 
+def forecast_grid(L_inf, K, t0, maturity_age_years, days_before_maturity, horizon_months=12, step_months=1):
+    """
+    Vectorized growth forecast for many fish at once.
+
+    All parameters except horizon/step are NumPy arrays of shape (n,).
+    Forecast points are at step_months, 2*step_months, ... up to horizon_months.
+
+    :return: Dict of arrays: months (m,), current_age_years (n,), current_length_cm (n,),
+             current_stage (n,), age_years (n, m), length_cm (n, m), stage (n, m).
+             Stages are indices into STAGE_CLASSES.
+    """
+    current_age = maturity_age_years - (days_before_maturity / 365.0)
+    # Ensure current age is not below t0
+    current_age = np.where(current_age < t0, t0 + 0.1, current_age)
+
+    months = np.arange(step_months, horizon_months + 1, step_months)
+    ages = current_age[:, None] + months[None, :] / 12.0
+
+    current_length = _age_to_length_array(current_age, L_inf, K, t0)
+    lengths = _age_to_length_array(ages, L_inf[:, None], K[:, None], t0[:, None])
 
-    # Get growth parameters from your config
-    species_key = species.upper().strip()
-    params = GROWTH_PARAMETERS.get(species_key)
-    if not params:
-        available_species = list(GROWTH_PARAMETERS.keys())
-        logging.warning(f"Species not found: {species}. Available species: {available_species}")
-        return {"error": f"No growth parameters for {species}. Available: {available_species}"}
-    
-    L_inf = params["L_inf"]
-    K = params["K"]
-    t0 = params["t0"]
-    
-    # Calculate maturity age first (using your actual parameters)
-    maturity_length = L_inf * 0.8  # 80% of L_inf is typically maturity
-    maturity_age_years = calculate_age_from_length(maturity_length, L_inf, K, t0)
-    
-    # Calculate current age and length
-    current_age_years = maturity_age_years - (days_before_maturity / 365.0)
-    
-    # Ensure current age is not negative
-    if current_age_years < t0:
-        current_age_years = t0 + 0.1  # Start slightly above t0
-    
-    current_length = age_to_length(current_age_years, L_inf, K, t0)
-
-    # Get current size classification
-    current_stage_class = get_size_classification(current_length,L_inf)
-    
-    # Generate 12-month forecast
-    monthly_forecast = []
-    previous_length = current_length
-    
-    for month in range(1, 13):
-        future_age = current_age_years + (month / 12.0)
-        future_length = age_to_length(future_age, L_inf, K, t0)
-
-        # Get size classification for the future month
-        future_stage_class = get_size_classification(future_length, L_inf)
-        
-        # Calculate growth from previous month
-        growth = future_length - previous_length
-        
-        forecast_date = current_date + timedelta(days=30 * month)
-        
-        monthly_forecast.append({
-            "month": month,
-            "date": forecast_date.strftime("%Y-%m-%d"),
-            "age_years": round(future_age, 2),
-            "length_cm": round(future_length, 2),
-            "growth_cm": round(growth, 2),
-            "total_growth_cm": round(future_length - current_length, 2),
-            "future_stage_class": future_stage_class["class"],
-        })
-        
-        previous_length = future_length
-        logging.info(f"Forecast for {species} Month {month}: Age {future_age}, Length {future_length}")
-    
-    logging.info(f"Completed forecast for {species}")
     return {
-        "current_status": {
-            "days_before_maturity": days_before_maturity,
-            "current_age_years": round(current_age_years, 2),
-            "current_length_cm": round(current_length, 2),
-            "maturity_length_cm": round(maturity_length, 2),
-            "maturity_age_years": round(maturity_age_years, 2),
-            "current_stage_class": current_stage_class["class"]
-        },
-        "monthly_forecast": monthly_forecast
+        "months": months,
+        "current_age_years": current_age,
+        "current_length_cm": current_length,
+        "current_stage": _stage_index(current_length / L_inf * 100),
+        "age_years": ages,
+        "length_cm": lengths,
+        "stage": _stage_index(lengths / L_inf[:, None] * 100),
     }
 
 
+def _age_to_length_array(age_years, L_inf, K, t0):
+    """Array version of age_to_length."""
+    return np.where(age_years <= t0, 0.1, L_inf * (1 - np.exp(-K * (age_years - t0))))
+
+
+def _stage_index(percentage):
+    """Array version of get_size_classification (default thresholds) returning class indices."""
+    return (percentage >= DEFAULT_SIZE_THRESHOLDS["SMALL"]).astype(np.int8) + \
+        (percentage >= DEFAULT_SIZE_THRESHOLDS["MEDIUM"]).astype(np.int8)
+
+
+def _validate_entry(species, days_before_maturity):
+    """Return (species_key, error) for one forecast request entry."""
+    if not isinstance(days_before_maturity, (int, float)) or isinstance(days_before_maturity, bool):
+        return None, {"error": f"Could not process {species}"}
+
+    if days_before_maturity < 0:
+        logging.warning(f"Negative days before maturity for {species}: {days_before_maturity}")
+        return None, {"error": f"Invalid days before maturity for {species}: {days_before_maturity}"}
+
+    species_key = str(species).upper().strip()
+    if species_key not in FORECAST_CONSTANTS:
+        available_species = list(GROWTH_CONSTANTS.keys())
+        logging.warning(f"Species not found: {species}. Available species: {available_species}")
+        return None, {"error": f"No growth parameters for {species}. Available: {available_species}"}
+
+    return species_key, None
+
+
+def forecast_entries(entries, current_date, horizon_months=12, step_months=1):
+    """
+    Forecast many (species, days_before_maturity) entries in one vectorized pass.
+
+    :return: List of forecast dicts (or {"error": ...}) in the same order as entries
+    """
+    results = [None] * len(entries)
+    valid_positions = []
+    constants = []
+    days = []
+    for position, (species, days_before_maturity) in enumerate(entries):
+        species_key, error = _validate_entry(species, days_before_maturity)
+        if error:
+            results[position] = error
+            continue
+        valid_positions.append(position)
+        constants.append(FORECAST_CONSTANTS[species_key])
+        days.append(days_before_maturity)
+
+    if not valid_positions:
+        return results
+
+    L_inf, K, t0, maturity_length, maturity_age = (np.array(column, dtype=float) for column in zip(*constants))
+    grid = forecast_grid(L_inf, K, t0, maturity_age, np.array(days, dtype=float), horizon_months, step_months)
+
+    months = grid["months"].tolist()
+    dates = [(current_date + timedelta(days=30 * month)).strftime("%Y-%m-%d") for month in months]
+    current_age, current_length = grid["current_age_years"].tolist(), grid["current_length_cm"].tolist()
+    current_stage = STAGE_CLASSES[grid["current_stage"]].tolist()
+    ages, lengths = grid["age_years"].tolist(), grid["length_cm"].tolist()
+    stages = STAGE_CLASSES[grid["stage"]].tolist()
+    maturity_length, maturity_age = maturity_length.tolist(), maturity_age.tolist()
+
+    for row, position in enumerate(valid_positions):
+        monthly_forecast = []
+        previous_length = current_length[row]
+        for col, month in enumerate(months):
+            future_length = lengths[row][col]
+            monthly_forecast.append({
+                "month": month,
+                "date": dates[col],
+                "age_years": round(ages[row][col], 2),
+                "length_cm": round(future_length, 2),
+                "growth_cm": round(future_length - previous_length, 2),
+                "total_growth_cm": round(future_length - current_length[row], 2),
+                "future_stage_class": stages[row][col],
+            })
+            previous_length = future_length
+
+        results[position] = {
+            "current_status": {
+                "days_before_maturity": days[row],
+                "current_age_years": round(current_age[row], 2),
+                "current_length_cm": round(current_length[row], 2),
+                "maturity_length_cm": round(maturity_length[row], 2),
+                "maturity_age_years": round(maturity_age[row], 2),
+                "current_stage_class": current_stage[row]
+            },
+            "monthly_forecast": monthly_forecast
+        }
+
+    return results
+
+
+@lru_cache(maxsize=FORECAST_CACHE_SIZE, typed=True)
+def _cached_species_forecast(species, days_before_maturity, date_key):
+    current_date = datetime.strptime(date_key, "%Y-%m-%d")
+    return forecast_entries([(species, days_before_maturity)], current_date)[0]
+
+
+_forecast_cache_date = None
+_forecast_cache_lock = threading.Lock()
+
+
+def calculate_species_forecast(species, days_before_maturity, current_date):
+    """
+    Calculate monthly growth forecast for a species using UTILS.py parameters.
+
+    The result only depends on the inputs and the calendar date, so it is
+    memoized (LRU) and the cache is cleared when the date rolls over.
+    Cached results are shared; treat them as read-only.
+    """
+    global _forecast_cache_date
+    date_key = current_date.strftime("%Y-%m-%d")
+    if date_key != _forecast_cache_date:
+        with _forecast_cache_lock:
+            if date_key != _forecast_cache_date:
+                _cached_species_forecast.cache_clear()
+                _forecast_cache_date = date_key
+
+    try:
+        forecast = _cached_species_forecast(species, days_before_maturity, date_key)
+    except TypeError:
+        # Unhashable input (e.g. a list from JSON) cannot be cached
+        forecast = forecast_entries([(species, days_before_maturity)], current_date)[0]
+
+    if "error" not in forecast:
+        logging.info(f"Completed forecast for {species}")
+    return forecast
+
+
+def forecast_cache_info():
+    """LRU statistics of the species forecast cache."""
+    return _cached_species_forecast.cache_info()._asdict()
+
+
 def generate_monthly_forecast(species_days_map):
     """Generate monthly forecast for multiple species"""
     try:
-        logging.info(f"Monthly forecast requested: {species_days_map}")
-        
+        log_payload("Monthly forecast requested", species_days_map)
+
         if not species_days_map:
             return {"error": "No species data provided"}
-        
+
         # Process each fish species
         forecasts = {}
         current_date = datetime.now()
-        
+
         for species, days_before_maturity in species_days_map.items():
             try:
                 species_forecast = calculate_species_forecast(
-                    species, 
-                    days_before_maturity, 
+                    species,
+                    days_before_maturity,
                     current_date
                 )
                 forecasts[species] = species_forecast
             except Exception as e:
                 logging.error(f"Error processing {species}: {str(e)}")
                 forecasts[species] = {"error": f"Could not process {species}"}
-        
+
         logging.info(f"Forecast completed: {len(forecasts)} species processed")
         return {
             "message": "Monthly forecast generated successfully",
             "generated_date": current_date.isoformat(),
             "forecasts": forecasts
         }
-        
+
     except Exception as e:
         logging.exception("Error in monthly forecast generation")
-        return {"error": f"Server error: {str(e)}"}
\ No newline at end of file
+        return {"error": f"Server error: {str(e)}"}
+
+
+def generate_bulk_forecast(request_data):
+    """
+    Bulk forecast for many fish: {"entries": [{"species": ..., "days_before_maturity": ...}, ...],
+    "horizon_months": 12, "step_months": 1}. Results are returned in entry order.
+    """
+    try:
+        entries = request_data.get("entries")
+        if not isinstance(entries, list) or not entries:
+            return {"error": "No entries provided"}
+        if len(entries) > FORECAST_MAX_ENTRIES:
+            return {"error": f"Too many entries, maximum is {FORECAST_MAX_ENTRIES}"}
+
+        horizon_months = request_data.get("horizon_months", 12)
+        step_months = request_data.get("step_months", 1)
+        if not isinstance(horizon_months, int) or not 1 <= horizon_months <= FORECAST_MAX_HORIZON_MONTHS:
+            return {"error": f"horizon_months must be an integer between 1 and {FORECAST_MAX_HORIZON_MONTHS}"}
+        if not isinstance(step_months, int) or not 1 <= step_months <= horizon_months:
+            return {"error": "step_months must be an integer between 1 and horizon_months"}
+
+        pairs = []
+        for entry in entries:
+            if isinstance(entry, dict):
+                pairs.append((entry.get("species"), entry.get("days_before_maturity")))
+            else:
+                pairs.append((None, None))
+
+        current_date = datetime.now()
+        forecasts = forecast_entries(pairs, current_date, horizon_months, step_months)
+        for (species, days_before_maturity), forecast in zip(pairs, forecasts):
+            forecast["species"] = species
+
+        logging.info(f"Bulk forecast completed: {len(forecasts)} entries, horizon={horizon_months}, step={step_months}")
+        return {
+            "message": "Monthly forecast generated successfully",
+            "generated_date": current_date.isoformat(),
+            "horizon_months": horizon_months,
+            "step_months": step_months,
+            "forecasts": forecasts
+        }
+
+    except Exception as e:
+        logging.exception("Error in bulk forecast generation")
+        return {"error": f"Server error: {str(e)}"}
@@ -0,0 +1,171 @@
+# predictionstore.py
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from dotenv import load_dotenv
+from services.metrics import STAGE_ERRORS
+from services.admission import DeadlineExceeded, Overloaded
+
+load_dotenv()
+
+DB_PATH = os.getenv("PREDICTIONS_DB_PATH", "predictions.db")
+
+SQLITE_BUSY_TIMEOUT = 10  # Seconds to wait on a locked database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    detection_id TEXT,
+    species TEXT COLLATE NOCASE,
+    confidence REAL,
+    width_px REAL,
+    height_px REAL,
+    width_cm REAL,
+    height_cm REAL,
+    length_cm REAL,
+    area_cm2 REAL,
+    days_before_maturity REAL,
+    pixels_per_cm REAL,
+    coin_label TEXT COLLATE NOCASE,
+    coin_confidence REAL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions (created_at);
+-- Filtered pages are read newest first by id, so the filter indexes end in id (no sort step)
+CREATE INDEX IF NOT EXISTS idx_predictions_species_id ON predictions (species, id);
+CREATE INDEX IF NOT EXISTS idx_predictions_coin_label_id ON predictions (coin_label, id);
+"""
+
+COLUMNS = [
+    "id", "detection_id", "species", "confidence", "width_px", "height_px",
+    "width_cm", "height_cm", "length_cm", "area_cm2", "days_before_maturity",
+    "pixels_per_cm", "coin_label", "coin_confidence", "created_at",
+]
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+
+def get_connection(db_path=None):
+    """Return this thread's connection to the prediction store, creating the schema once."""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _schema_lock:
+            if db_path not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready.add(db_path)
+        connections[db_path] = conn
+    return conn
+
+
+def save_prediction(processed_result, db_path=None, deadline=None):
+    """
+    Store one row per detected fish. Returns the number of rows written.
+
+    With a deadline, waiting on a locked database is limited to the time left;
+    running out raises DeadlineExceeded instead of returning 0.
+    """
+    coin_used = processed_result.get("coin_used") or {}
+    coin_label = coin_used.get("coin_label") or "Default"
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = [
+        (
+            fish.get("id"),
+            fish.get("species"),
+            fish.get("confidence"),
+            fish.get("width_px"),
+            fish.get("height_px"),
+            fish.get("width_cm"),
+            fish.get("height_cm"),
+            fish.get("length_cm"),
+            fish.get("area_cm2"),
+            fish.get("days_before_maturity"),
+            coin_used.get("pixels_per_cm"),
+            coin_label,
+            coin_used.get("coin_confidence", 0),
+            created_at,
+        )
+        for fish in processed_result.get("fish_detected", [])
+    ]
+    if not rows:
+        return 0
+
+    try:
+        if deadline is not None:
+            deadline.check("saving prediction")
+        conn = get_connection(db_path)
+        busy_timeout_ms = int((deadline.remaining() if deadline is not None else SQLITE_BUSY_TIMEOUT) * 1000)
+        conn.execute(f"PRAGMA busy_timeout = {busy_timeout_ms}")
+        with conn:
+            conn.executemany(
+                f"INSERT INTO predictions ({', '.join(COLUMNS[1:])}) "
+                f"VALUES ({', '.join('?' for _ in COLUMNS[1:])})",
+                rows,
+            )
+        return len(rows)
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded("Deadline exceeded while saving prediction") from e
+        STAGE_ERRORS.inc(stage="store_save")
+        logging.error(f"Failed to save prediction to local store: {e}")
+        return 0
+
+
+def build_query(species=None, coin_label=None, start=None, end=None, limit=50, cursor=None):
+    """Return (sql, params) for query_predictions; one row more than limit is fetched to detect the last page."""
+    clauses = []
+    params = []
+    if species:
+        clauses.append("species = ?")
+        params.append(species)
+    if coin_label:
+        clauses.append("coin_label = ?")
+        params.append(coin_label)
+    if start:
+        clauses.append("created_at >= ?")
+        params.append(start)
+    if end:
+        clauses.append("created_at < ?")
+        params.append(end)
+    if cursor is not None:
+        clauses.append("id < ?")
+        params.append(cursor)
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    sql = f"SELECT {', '.join(COLUMNS)} FROM predictions {where} ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+    return sql, params
+
+
+def query_predictions(species=None, coin_label=None, start=None, end=None,
+                      limit=50, cursor=None, db_path=None):
+    """
+    Fetch predictions newest first, filtered by species, coin label and time range.
+
+    Pagination is keyset based: pass the returned next_cursor to get the next
+    page, so each page costs the same no matter how deep it is.
+
+    :param start: Inclusive lower bound on created_at ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS")
+    :param end: Exclusive upper bound on created_at
+    :return: Dict with predictions and next_cursor (None on the last page)
+    """
+    sql, params = build_query(species, coin_label, start, end, limit, cursor)
+    rows = get_connection(db_path).execute(sql, params).fetchall()
+    predictions = [dict(row) for row in rows[:limit]]
+    next_cursor = predictions[-1]["id"] if len(rows) > limit else None
+    return {"predictions": predictions, "next_cursor": next_cursor}
@@ -0,0 +1,322 @@
+# resilience.py
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+import backoff
+import numpy as np
+import requests
+from services.config import INFERENCE_TIMEOUT, INFERENCE_MAX_TRIES, INFERENCE_RETRY_BACKOFF
+from services.config import INFERENCE_RETRY_RATIO, INFERENCE_RETRY_RESERVE
+from services.config import INFERENCE_CIRCUIT_FAILURES, INFERENCE_CIRCUIT_RESET
+from services.config import INFERENCE_HEDGE_PERCENTILE, INFERENCE_HEDGE_MIN_SAMPLES, INFERENCE_HEDGE_WINDOW
+from services.config import INFERENCE_HEDGE_WORKERS
+from services.admission import DeadlineExceeded
+from services.metrics import INFERENCE_RETRIES, INFERENCE_HEDGES, INFERENCE_CIRCUIT_STATE, INFERENCE_SHORT_CIRCUITED
+
+INFERENCE_HEDGING_ENABLED = os.getenv("INFERENCE_HEDGING", "false").lower() in ("1", "true", "yes")
+
+# Runs the attempts of hedged calls. Sized for ADMISSION_LIMITS["inference"] calls with two attempts each.
+HEDGE_EXECUTOR = ThreadPoolExecutor(max_workers=INFERENCE_HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+class CircuitOpen(Exception):
+    """The model's circuit is open, so the call was not attempted."""
+
+
+def is_transient(error):
+    """Timeouts, connection errors, 5xx and 429 are worth retrying. Anything else is not."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    if isinstance(error, (requests.Timeout, requests.ConnectionError, asyncio.TimeoutError)):
+        return True
+    aiohttp = sys.modules.get("aiohttp")  # Only loaded by the async server
+    if aiohttp is not None:
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return isinstance(error, aiohttp.ClientConnectionError)
+    return False
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive transient failures. While open,
+    calls fail fast with CircuitOpen. After reset_timeout a single probe call is
+    let through (half-open) and its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless the call may go ahead."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+        INFERENCE_SHORT_CIRCUITED.inc(model=self.name)
+        raise CircuitOpen(f"Inference for {self.name} is temporarily unavailable (circuit open)")
+
+    def record(self, success):
+        """Record a call outcome: True, False (transient failure) or None (cancelled or non-transient error, no verdict)."""
+        with self._lock:
+            if success is None:
+                self._probe_in_flight = False
+            elif success:
+                if self.state != self.CLOSED:
+                    logging.info(f"Inference circuit for {self.name} closed")
+                self.state = self.CLOSED
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                    logging.warning(f"Inference circuit for {self.name} opened after {self.failures} failures")
+                    self.state = self.OPEN
+                    self.opened_at = time.monotonic()
+                    self._probe_in_flight = False
+
+
+class RetryBudget:
+    """
+    Token bucket shared by the retries and hedges of one model. Every call adds
+    ratio tokens and every extra attempt spends one, so a failing backend sees
+    about (1 + ratio) times the normal load instead of max_tries times.
+    """
+
+    def __init__(self, ratio, reserve):
+        self.ratio = ratio
+        self.reserve = reserve
+        self.tokens = float(reserve)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.reserve, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class LatencyWindow:
+    """Latencies of recent successful attempts, used for the hedge delay."""
+
+    def __init__(self, size):
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self._samples.append(seconds)
+
+    def percentile(self, q, min_samples):
+        samples = list(self._samples)
+        if len(samples) < min_samples:
+            return None
+        return float(np.percentile(samples, q))
+
+
+class ResilientEndpoint:
+    """
+    Per-attempt timeouts, budgeted retries with backoff, a circuit breaker and
+    optional hedging for one remote model.
+
+    attempt(timeout) makes one remote call bounded by timeout seconds. With
+    hedging on, an attempt that is still running after the recent p95 latency
+    gets a duplicate and the first good answer wins.
+    """
+
+    def __init__(self, name, hedging=INFERENCE_HEDGING_ENABLED):
+        self.name = name
+        self.hedging = hedging
+        self.breaker = CircuitBreaker(name, INFERENCE_CIRCUIT_FAILURES, INFERENCE_CIRCUIT_RESET)
+        self.budget = RetryBudget(INFERENCE_RETRY_RATIO, INFERENCE_RETRY_RESERVE)
+        self.latencies = LatencyWindow(INFERENCE_HEDGE_WINDOW)
+        INFERENCE_CIRCUIT_STATE.set_function(lambda: self.breaker.state, model=name)
+
+    def _retry_policy(self, tries, deadline):
+        def give_up(error):
+            # Checked before spending a token, so the last attempt does not use up the budget
+            if tries[0] >= INFERENCE_MAX_TRIES or not is_transient(error) or self.breaker.state == CircuitBreaker.OPEN:
+                return True
+            return not self.budget.withdraw()
+
+        def on_backoff(details):
+            INFERENCE_RETRIES.inc(model=self.name)
+
+        return backoff.on_exception(
+            backoff.expo, Exception,
+            factor=INFERENCE_RETRY_BACKOFF,
+            giveup=give_up,
+            max_time=deadline.remaining() if deadline is not None else None,
+            on_backoff=on_backoff,
+            giveup_log_level=logging.DEBUG,  # run_inference callers log the failure
+        )
+
+    def _attempt_timeout(self, deadline):
+        if deadline is None:
+            return INFERENCE_TIMEOUT
+        remaining = deadline.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded before {self.name} inference")
+        return min(INFERENCE_TIMEOUT, remaining)
+
+    def _hedge_delay(self, timeout):
+        if not self.hedging:
+            return None
+        delay = self.latencies.percentile(INFERENCE_HEDGE_PERCENTILE, INFERENCE_HEDGE_MIN_SAMPLES)
+        return delay if delay is not None and delay < timeout else None
+
+    def call(self, attempt, deadline=None):
+        """Run attempt with retries; raises the last error, CircuitOpen or DeadlineExceeded."""
+        self.budget.deposit()
+        tries = [0]
+
+        @self._retry_policy(tries, deadline)
+        def run():
+            tries[0] += 1
+            timeout = self._attempt_timeout(deadline)
+            delay = self._hedge_delay(timeout)
+            if delay is None:
+                return self._timed(attempt, timeout)
+            return self._hedged(attempt, timeout, delay)
+
+        return run()
+
+    def _timed(self, attempt, timeout):
+        self.breaker.before_call()
+        success = None
+        start = time.perf_counter()
+        try:
+            result = attempt(timeout)
+            success = True
+            self.latencies.add(time.perf_counter() - start)
+            return result
+        except Exception as e:
+            # Non-transient errors (4xx, bad responses) say nothing about the backend's health
+            success = False if is_transient(e) else None
+            raise
+        finally:
+            self.breaker.record(success)
+
+    def _hedged(self, attempt, timeout, delay):
+        expires_at = time.monotonic() + timeout
+        primary = HEDGE_EXECUTOR.submit(self._timed, attempt, timeout)
+        roles = {primary: "primary"}
+        try:
+            done, _ = wait_futures([primary], timeout=delay)
+            if not done and self.budget.withdraw():
+                roles[HEDGE_EXECUTOR.submit(self._timed, attempt, timeout - delay)] = "hedge"
+
+            # The per-attempt timeout only bounds each socket operation, and attempts may
+            # still be queued behind a busy executor, so the whole call is bounded here
+            pending, error = set(roles), None
+            while pending:
+                done, pending = wait_futures(pending, timeout=max(0.0, expires_at - time.monotonic()),
+                                             return_when=FIRST_COMPLETED)
+                if not done:
+                    error = requests.Timeout(f"{self.name} inference did not finish within {timeout:.2f}s")
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        if len(roles) > 1:
+                            INFERENCE_HEDGES.inc(model=self.name, winner=roles[future])
+                        return future.result()
+                    error = error or future.exception()
+            if len(roles) > 1:
+                INFERENCE_HEDGES.inc(model=self.name, winner="none")
+            raise error
+        finally:
+            # Attempts still queued are dropped; a running one cannot be cancelled and
+            # finishes in the background
+            for future in roles:
+                future.cancel()
+
+    async def call_async(self, attempt, deadline=None):
+        """Awaitable call() for the async server; attempt(timeout) returns an awaitable."""
+        self.budget.deposit()
+        tries = [0]
+
+        @self._retry_policy(tries, deadline)
+        async def run():
+            tries[0] += 1
+            timeout = self._attempt_timeout(deadline)
+            delay = self._hedge_delay(timeout)
+            if delay is None:
+                return await self._timed_async(attempt, timeout)
+            return await self._hedged_async(attempt, timeout, delay)
+
+        return await run()
+
+    async def _timed_async(self, attempt, timeout):
+        self.breaker.before_call()
+        success = None
+        start = time.perf_counter()
+        try:
+            result = await attempt(timeout)
+            success = True
+            self.latencies.add(time.perf_counter() - start)
+            return result
+        except Exception as e:
+            # Non-transient errors (4xx, bad responses) say nothing about the backend's health
+            success = False if is_transient(e) else None
+            raise
+        finally:
+            self.breaker.record(success)
+
+    async def _hedged_async(self, attempt, timeout, delay):
+        primary = asyncio.ensure_future(self._timed_async(attempt, timeout))
+        roles = {primary: "primary"}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self.budget.withdraw():
+                return await primary
+
+            roles[asyncio.ensure_future(self._timed_async(attempt, timeout - delay))] = "hedge"
+            pending, error = set(roles), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        INFERENCE_HEDGES.inc(model=self.name, winner=roles[task])
+                        return task.result()
+                    error = error or task.exception()
+            INFERENCE_HEDGES.inc(model=self.name, winner="none")
+            raise error
+        finally:
+            for task in roles:
+                task.cancel()
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def get_endpoint(name):
+    """Return the ResilientEndpoint for a model (keyed by its model id env var)."""
+    endpoint = _endpoints.get(name)
+    if endpoint is None:
+        with _endpoints_lock:
+            endpoint = _endpoints.get(name)
+            if endpoint is None:
+                endpoint = _endpoints[name] = ResilientEndpoint(name)
+    return endpoint
@@ -1,32 +1,82 @@
 from dotenv import load_dotenv
 import logging
-from services.utils import convert_bbox_to_cm as convert, run_inference
-from services.utils import calculate_pixels_per_cm
+from services.utils import convert_bbox_to_cm as convert, run_inference, run_inference_async
+from services.utils import calculate_pixels_per_cm, prepare_inference_image
 import math
-from services.config import CLASS_ID_TO_COIN, GROWTH_PARAMETERS,  PIXELS_PER_CM
+import numpy as np
+from services.config import CLASS_ID_TO_COIN, GROWTH_PARAMETERS,  PIXELS_PER_CM, BATCH_MAX_WORKERS
+from services.config import GROWTH_CONSTANTS, ADMISSION_LIMITS, ADMISSION_MAX_WAITING
+from services.config import ADMISSION_MAX_WAIT, UPLOAD_DEADLINE_SECONDS, CALIBRATION_ASPECT_TOLERANCE
 from services.storage import save_to_sheets
+from services.predictionstore import save_prediction
+from services.metrics import STAGE_LATENCY, STAGE_ERRORS, PREDICTIONS
+from services.logpipeline import log_payload
+from services.admission import admission, Deadline, DeadlineExceeded, Overloaded
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+import time
+import asyncio
 load_dotenv()  # Load environment variables
 
 
+# Shared pool so the fish and coin models can be called at the same time. One thread for every
+# call the "inference" stage admits or lets wait, so excess calls are rejected there (429)
+# instead of queueing unseen in the executor
+INFERENCE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=ADMISSION_LIMITS["inference"] + ADMISSION_MAX_WAITING, thread_name_prefix="inference"
+)
+
+# Bounded pool for whole-image jobs from /upload/batch; kept separate from
+# INFERENCE_EXECUTOR because each job waits on inference futures itself
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix="batch")
+
+
 #  Fish Species Detection and Measurement
 
-def predict_fish_specie(image_file):
-    """Detect fish species."""
-    logging.info(f"Running fish species prediction for: {image_file}")
-    result = run_inference(image_file, "API_KEY", "MODEL_ID")
+def predict_fish_specie(image, deadline=None):
+    """Detect fish species. image is the encoded image bytes or a file path."""
+    logging.info("Running fish species prediction")
+    with STAGE_LATENCY.time(stage="fish_inference"):
+        result = run_inference(image, "API_KEY", "MODEL_ID", deadline=deadline)
+    return _fish_result(result)
+
+
+async def predict_fish_specie_async(image, deadline=None):
+    """Awaitable predict_fish_specie for the async server."""
+    logging.info("Running fish species prediction")
+    with STAGE_LATENCY.time(stage="fish_inference"):
+        result = await run_inference_async(image, "API_KEY", "MODEL_ID", deadline=deadline)
+    return _fish_result(result)
+
+
+def _fish_result(result):
     if "error" in result:
-        logging.error(f"Fish detection failed: {result}")
+        STAGE_ERRORS.inc(stage="fish_inference")
+        logging.error("Fish detection failed: %s", result)
     else:
         logging.info(f"Fish detection successful: {len(result.get('predictions', []))} predictions found")
     return result
   
-def detect_reference_coin(image_file):
-    """Detect coin reference for calibration."""
-    logging.info(f"Running coin detection for: {image_file}")
-    result = run_inference(image_file, "REFERENCE_API_KEY", "COIN_MODEL_ID")
+def detect_reference_coin(image, deadline=None):
+    """Detect coin reference for calibration. image is the encoded image bytes or a file path."""
+    logging.info("Running coin detection")
+    with STAGE_LATENCY.time(stage="coin_inference"):
+        result = run_inference(image, "REFERENCE_API_KEY", "COIN_MODEL_ID", deadline=deadline)
+    return _coin_calibration(result)
+
+
+async def detect_reference_coin_async(image, deadline=None):
+    """Awaitable detect_reference_coin for the async server."""
+    logging.info("Running coin detection")
+    with STAGE_LATENCY.time(stage="coin_inference"):
+        result = await run_inference_async(image, "REFERENCE_API_KEY", "COIN_MODEL_ID", deadline=deadline)
+    return _coin_calibration(result)
 
+
+def _coin_calibration(result):
+    """Pick the most confident coin from a coin model result and derive pixels_per_cm."""
     if "error" in result:
-        logging.error(f"Coin detection failed: {result}")
+        STAGE_ERRORS.inc(stage="coin_inference")
+        logging.error("Coin detection failed: %s", result)
         return result
 
     if not result or "predictions" not in result or len(result["predictions"]) == 0:
@@ -40,11 +90,73 @@ def detect_reference_coin(image_file):
     coin_confidence = coin_prediction.get("confidence", 0)
 
     logging.info(f"Coin detected: class_id={coin_class_id}, label={coin_label}, confidence={coin_confidence:.2f}")
-    return calculate_pixels_per_cm(coin_prediction, coin_label, coin_confidence)
+    coin_result = calculate_pixels_per_cm(coin_prediction, coin_label, coin_confidence)
+    # pixels_per_cm only holds for images of this size (see session_coin_result)
+    image = result.get("image") or {}
+    coin_result["image_width"], coin_result["image_height"] = image.get("width"), image.get("height")
+    return coin_result
+
+
+def _timed(func, *args):
+    """Run func and return (result, elapsed_ms)."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, round((time.perf_counter() - start) * 1000, 2)
+
+
+def detect_fish_and_coin(image, deadline=None, detect_coin=True, decoded=None):
+    """
+    Run fish and coin detection concurrently on the shared executor.
+
+    Both models are started at the same moment. If no fish is found the coin
+    future is cancelled (or its result dropped if it already started).
+    With detect_coin=False (calibration session) only the fish model runs.
+    With a deadline, waiting past it raises DeadlineExceeded. On any error (deadline,
+    overload) calls that have not started yet are cancelled.
+    decoded is the image already decoded by the quality gate, if any.
+
+    :return: Tuple of (fish_result, coin_result, timings_ms); coin_result is None when skipped
+    """
+    start = time.perf_counter()
+    with STAGE_LATENCY.time(stage="preprocess"):
+        image = prepare_inference_image(image, decoded)
+    preprocess_ms = round((time.perf_counter() - start) * 1000, 2)
+    fish_future = INFERENCE_EXECUTOR.submit(_timed, predict_fish_specie, image, deadline)
+    coin_future = INFERENCE_EXECUTOR.submit(_timed, detect_reference_coin, image, deadline) if detect_coin else None
+
+    try:
+        try:
+            fish_result, fish_ms = fish_future.result(timeout=deadline.remaining() if deadline else None)
+        except FutureTimeoutError:
+            raise DeadlineExceeded("Deadline exceeded during fish detection")
+        timings = {"preprocess_ms": preprocess_ms, "fish_ms": fish_ms, "coin_ms": None}
+
+        if coin_future is None:
+            coin_result = None
+        elif "error" in fish_result or not fish_result.get("predictions"):
+            if not coin_future.cancel():
+                logging.info("No fish detected, dropping coin detection result")
+            coin_result = None
+        else:
+            try:
+                coin_result, coin_ms = coin_future.result(timeout=deadline.remaining() if deadline else None)
+            except FutureTimeoutError:
+                raise DeadlineExceeded("Deadline exceeded during coin detection")
+            timings["coin_ms"] = coin_ms
+    except Exception:
+        # Running calls finish within their deadline-bounded timeout; queued ones never start
+        for future in (fish_future, coin_future):
+            if future is not None:
+                future.cancel()
+        raise
+
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    logging.info(f"Detection timings: {timings}")
+    return fish_result, coin_result, timings
 
 
 def estimate_age(length_cm, species, maturity_threshold=0.8):
-    logging.info(f"Estimating age for species={species}, length_cm={length_cm}")
+    logging.debug("Estimating age for species=%s, length_cm=%s", species, length_cm)
     param = GROWTH_PARAMETERS.get(species, GROWTH_PARAMETERS.get(species.upper()))
     if param is None:
         logging.error(f"Unknown species: {species}")
@@ -56,15 +168,15 @@ def estimate_age(length_cm, species, maturity_threshold=0.8):
         t0 = param["t0"]
 
         if length_cm >= L_inf * maturity_threshold:
-            logging.info(f"{species} is already mature at length {length_cm} cm")
+            logging.debug("%s is already mature at length %s cm", species, length_cm)
             return {"days_before_maturity": 0}
 
         maturity_length = L_inf * maturity_threshold
-        logging.info(f"Estimating maturity for {species}, maturity_length={maturity_length} cm")
+        logging.debug("Estimating maturity for %s, maturity_length=%s cm", species, maturity_length)
 
         maturity_fraction = (L_inf - maturity_length) / L_inf
         current_fraction = (L_inf - length_cm) / L_inf
-        logging.info(f"Current fraction for {species} at length {length_cm} cm: {current_fraction:.2f}")
+        logging.debug("Current fraction for %s at length %s cm: %.2f", species, length_cm, current_fraction)
         
         if maturity_fraction <= 0:
             logging.warning(f"Maturity length {maturity_length} cm exceeds L_inf {L_inf} cm for {species}")
@@ -78,7 +190,7 @@ def estimate_age(length_cm, species, maturity_threshold=0.8):
 
         days_before_maturity = maturity_age_days - current_age_days
 
-        logging.info(f"Estimated {days_before_maturity:.2f} days before maturity for {species}")
+        logging.debug("Estimated %.2f days before maturity for %s", days_before_maturity, species)
         return {"days_before_maturity": max(0, round(days_before_maturity, 2))}
 
     except Exception as e:
@@ -87,18 +199,130 @@ def estimate_age(length_cm, species, maturity_threshold=0.8):
 
 
 
-def process_prediction(result, image_file):
-    """Process fish detection and convert to cm using coin if available."""
+def estimate_days_before_maturity(lengths_cm, species):
+    """
+    Vectorized estimate_age for many fish of one species (default maturity threshold).
+
+    :param lengths_cm: NumPy array of lengths in cm
+    :return: NumPy array of days before maturity, or None if the species is unknown
+    """
+    constants = GROWTH_CONSTANTS.get(species, GROWTH_CONSTANTS.get(species.upper()))
+    if constants is None:
+        logging.error(f"Unknown species: {species}")
+        return None
+
+    L_inf = constants["L_inf"]
+    mature = lengths_cm >= constants["maturity_length"]
+    # Mature fish are clipped to a safe length so the log stays defined; their result is 0 anyway
+    safe_lengths = np.where(mature, 0.0, lengths_cm)
+    current_age_days = ((np.log((L_inf - safe_lengths) / L_inf) / -constants["K"]) + constants["t0"]) * 365
+    days = constants["maturity_age_days"] - current_age_days
+    return np.where(mature, 0.0, np.maximum(0.0, np.round(days, 2)))
+
+
+def measure_fish(predictions, pixels_per_cm):
+    """
+    Convert all detections to cm and estimate days before maturity in one NumPy pass.
+
+    :return: List of fish_data dicts in the same order as predictions
+    """
+    if not predictions:
+        return []
+
+    width_px = np.array([p.get("width", 0) for p in predictions], dtype=float)
+    height_px = np.array([p.get("height", 0) for p in predictions], dtype=float)
+    species = [p.get("class", "Unknown") for p in predictions]
+
+    width_cm, height_cm = convert(width_px, height_px, pixels_per_cm)
+    length_cm = np.maximum(width_cm, height_cm)  # The longest side is the length
+    area_cm2 = width_cm * height_cm
+
+    days_before_maturity = [None] * len(predictions)
+    species_array = np.array(species, dtype=object)
+    for name in set(species):
+        indices = np.flatnonzero(species_array == name)
+        days = estimate_days_before_maturity(length_cm[indices], name)
+        if days is not None:
+            for index, value in zip(indices.tolist(), days.tolist()):
+                days_before_maturity[index] = value
+
+    width_cm, height_cm, length_cm, area_cm2 = (
+        width_cm.tolist(), height_cm.tolist(), length_cm.tolist(), area_cm2.tolist()
+    )
+    return [
+        {
+            "id": prediction.get("detection_id", "Unknown"),
+            "species": species[i],
+            "confidence": prediction.get("confidence", 0),
+            "width_px": prediction.get("width", 0),
+            "height_px": prediction.get("height", 0),
+            "width_cm": width_cm[i],
+            "height_cm": height_cm[i],
+            "length_cm": length_cm[i],
+            "area_cm2": area_cm2[i],
+            "days_before_maturity": days_before_maturity[i],
+        }
+        for i, prediction in enumerate(predictions)
+    ]
+
+
+def session_coin_result(calibration, result):
+    """
+    The calibration session's coin result for this upload, or None if it cannot be reused.
+
+    pixels_per_cm was measured in the calibration photo's pixels. An upload of the same
+    frame at another resolution (same aspect ratio) gets it scaled by the resize factor;
+    a different aspect ratio (other camera mode, crop) or an unknown size cannot use it.
+    """
+    coin_result = calibration["calibration"]
+    image = result.get("image") or {}
+    width, height = image.get("width"), image.get("height")
+    session_width, session_height = coin_result.get("image_width"), coin_result.get("image_height")
+    if not (width and height and session_width and session_height):
+        logging.warning("Image size unknown, not reusing calibration session")
+        return None
+    if (width, height) == (session_width, session_height):
+        return coin_result
+
+    scale = width / session_width
+    if abs(height / session_height - scale) > CALIBRATION_ASPECT_TOLERANCE * scale:
+        logging.warning(f"Upload is {width}x{height} but the calibration photo was {session_width}x{session_height}, "
+                        f"falling back to coin detection")
+        return None
+    logging.info(f"Scaling calibration session by {scale:.3f} for a {width}x{height} upload")
+    return {
+        **coin_result,
+        "width_px": coin_result["width_px"] * scale,
+        "pixels_per_cm": coin_result["pixels_per_cm"] * scale,
+        "image_width": width,
+        "image_height": height,
+    }
+
+
+def process_prediction(result, image, coin_result=None, deadline=None, calibration=None):
+    """
+    Process fish detection and convert to cm using coin if available.
+
+    If coin_result is given (e.g. from detect_fish_and_coin) the coin model is not called again.
+    If calibration (a calibration session) is given, its pixels_per_cm is reused instead,
+    unless the image size does not fit the session (see session_coin_result).
+    The local store write goes through the "storage" admission stage within the deadline.
+    """
     if not result or "predictions" not in result or len(result["predictions"]) == 0:
         logging.warning("No fish detected in image")
         return {"message": "Walang Isda Na Nadetect", "fish_detected": []}
 
     
-    logging.info("Fish detected, checking for reference coin...")
-    coin_result = detect_reference_coin(image_file)
+    if calibration is not None:
+        coin_result = session_coin_result(calibration, result)
+        if coin_result is None:
+            calibration = None
+    if coin_result is None:
+        logging.info("Fish detected, checking for reference coin...")
+        coin_result = detect_reference_coin(image, deadline)
     pixels_per_cm = coin_result.get("pixels_per_cm", 0) if isinstance(coin_result, dict) else 0
 
-    logging.info(f"Coin result: {coin_result}")  # Log the coin result for debugging
+    log_payload("Coin result", coin_result, logging.DEBUG)  # Log the coin result for debugging
 
     # Fallback to default PIXELS_PER_CM if coin not detected
     if pixels_per_cm <= 0:
@@ -113,7 +337,7 @@ def process_prediction(result, image_file):
             "coin_confidence": 0
         }
     else:
-        logging.info(f"Using coin calibration: {coin_result}")
+        logging.info("Using coin calibration: %s", coin_result.get("coin_label"))
         coin_used = {
             "message": "Coin calibration successful",
             "coin_label": coin_result.get("coin_label"),
@@ -122,38 +346,15 @@ def process_prediction(result, image_file):
             "pixels_per_cm": coin_result.get("pixels_per_cm"),
             "coin_confidence": coin_result.get("coin_confidence", 0)
         }
+        if calibration is not None:
+            coin_used["message"] = "Using calibration session"
+            coin_used["calibration_session"] = calibration["session_id"]
 
-    logging.info(f"Coin used: {coin_used}")  # Log the coin used for debugging
-
-    detected_fish = []
-    for prediction in result["predictions"]:
-        fish_data = {
-            "id": prediction.get("detection_id", "Unknown"),
-            "species": prediction.get("class", "Unknown"),
-            "confidence": prediction.get("confidence", 0),
-            "width_px": prediction.get("width", 0),
-            "height_px": prediction.get("height", 0)
-        }
-
-        width_cm, height_cm = convert(
-            fish_data["width_px"], fish_data["height_px"], pixels_per_cm
-        )
-        # The longest side is now considered the length
-
-        length_cm = max(width_cm, height_cm)
-
-        estimate_age_result = estimate_age(length_cm, fish_data["species"])
-
-        fish_data.update({
-            "width_cm": width_cm,
-            "height_cm": height_cm,
-            "length_cm": length_cm,
-            "area_cm2": width_cm * height_cm,
-            "days_before_maturity": estimate_age_result.get("days_before_maturity")
-        })
-
-        logging.info(f"Processed fish: {fish_data}")
-        detected_fish.append(fish_data)
+    with STAGE_LATENCY.time(stage="measurement"):
+        detected_fish = measure_fish(result["predictions"], pixels_per_cm)
+    logging.info(f"Processed {len(detected_fish)} fish")
+    for fish in detected_fish:
+        PREDICTIONS.inc(species=fish["species"])
 
     final_result = {
         "message": "Fish species detected successfully",
@@ -161,17 +362,109 @@ def process_prediction(result, image_file):
         "fish_detected": detected_fish
     }
 
-    logging.info(f"Final processed result: {final_result}")
-    save_to_sheets(final_result)
+    log_payload("Final processed result", final_result)
+    with admission.limit("storage", deadline), STAGE_LATENCY.time(stage="store_save"):
+        save_prediction(final_result, deadline=deadline)
+    save_to_sheets(final_result, deadline=deadline)
     return final_result
 
 
+def analyze_image(image, deadline=None, calibration=None, decoded=None):
+    """
+    Full pipeline for one image: concurrent detection, calibration and age estimation.
+
+    :param deadline: Optional admission.Deadline; raises DeadlineExceeded once it passes
+    :param calibration: Optional calibration session; the coin model is skipped
+    :param decoded: Optional decoded image from the quality gate, to avoid decoding twice
+    """
+    result, coin_result, timings = detect_fish_and_coin(image, deadline, calibration is None, decoded)
+    if "error" in result:
+        logging.error(f"Prediction failed: {result['error']}")
+        return result
+
+    processed_result = process_prediction(result, image, coin_result, deadline, calibration)
+    processed_result["timings_ms"] = timings
+    return processed_result
 
 
+async def analyze_image_async(image, calibration=None, decoded=None, deadline=None):
+    """
+    analyze_image for the async server: both model calls are awaited concurrently
+    on the event loop, so no thread is held while waiting on the inference API.
+    Preprocessing and measurement/storage run in the loop's executor.
 
+    :param deadline: Optional admission.Deadline, as in analyze_image
+    """
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    with STAGE_LATENCY.time(stage="preprocess"):
+        image = await loop.run_in_executor(None, prepare_inference_image, image, decoded)
+    preprocess_ms = round((time.perf_counter() - start) * 1000, 2)
 
+    async def timed(coroutine):
+        call_start = time.perf_counter()
+        return await coroutine, round((time.perf_counter() - call_start) * 1000, 2)
 
+    fish_task = asyncio.ensure_future(timed(predict_fish_specie_async(image, deadline)))
+    coin_task = asyncio.ensure_future(timed(detect_reference_coin_async(image, deadline))) if calibration is None else None
+    try:
+        result, fish_ms = await fish_task
+    except BaseException:
+        if coin_task is not None:
+            coin_task.cancel()
+        raise
+    timings = {"preprocess_ms": preprocess_ms, "fish_ms": fish_ms, "coin_ms": None}
+
+    if coin_task is None:
+        coin_result = None
+    elif "error" in result or not result.get("predictions"):
+        coin_task.cancel()
+        coin_result = None
+    else:
+        coin_result, timings["coin_ms"] = await coin_task
 
+    timings["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    logging.info(f"Detection timings: {timings}")
+    if "error" in result:
+        logging.error(f"Prediction failed: {result['error']}")
+        return result
 
+    processed_result = await loop.run_in_executor(None, process_prediction, result, image, coin_result, deadline, calibration)
+    processed_result["timings_ms"] = timings
+    return processed_result
 
 
+def _analyze_batch_image(image, calibration, deadline):
+    with admission.limit("upload", deadline, max_wait=ADMISSION_MAX_WAIT):
+        return analyze_image(image, deadline, calibration)
+
+
+def analyze_images(images, calibration=None, deadline_seconds=UPLOAD_DEADLINE_SECONDS):
+    """
+    Run analyze_image for many images on the bounded batch pool.
+
+    Each image holds an "upload" admission slot while it runs, like a single
+    /upload, and must finish within deadline_seconds of being submitted.
+
+    Yields (index, status, result) as each image finishes, not in input order.
+    status is 200, 500 on errors, 429 when a stage is overloaded (retry_after
+    is in the result) or 504 past the deadline.
+    """
+    futures = {
+        BATCH_EXECUTOR.submit(_analyze_batch_image, image, calibration, Deadline(deadline_seconds)): index
+        for index, image in enumerate(images)
+    }
+    for future in as_completed(futures):
+        index = futures[future]
+        try:
+            result = future.result()
+            yield index, 500 if "error" in result else 200, result
+        except Overloaded as e:
+            logging.warning(f"Batch image {index} rejected: {e}")
+            yield index, 429, {"error": "Server is busy, please retry later", "retry_after": e.retry_after}
+        except DeadlineExceeded as e:
+            logging.warning(f"Batch image {index} cancelled: {e}")
+            yield index, 504, {"error": "Request timed out"}
+        except Exception as e:
+            logging.exception(f"Batch image {index} failed")
+            yield index, 500, {"error": f"Error processing image: {str(e)}"}
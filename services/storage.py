@@ -1,63 +1,225 @@
 import os
 import json
+import queue
+import threading
+import time
+import backoff
 from dotenv import load_dotenv
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 from services.config import REFERENCE_COINS_DIAMETER_CM as coin_mapping
+from services.config import SHEETS_QUEUE_SIZE, SHEETS_BATCH_SIZE, SHEETS_FLUSH_INTERVAL, SHEETS_MAX_RETRIES
+from services.config import SHEETS_WARM_UP_MAX_DELAY
+from services.metrics import STAGE_LATENCY, STAGE_ERRORS, SHEETS_QUEUE_DEPTH
 import logging
 
 
 load_dotenv()
 
+# Sheets is an export target; the local prediction store is the system of record
+SHEETS_EXPORT_ENABLED = os.getenv("SHEETS_EXPORT", "true").lower() in ("1", "true", "yes")
 
-creds_json = os.getenv("GOOGLE_CREDS_JSON")
-if not creds_json:
-    raise Exception("Environment variable GOOGLE_CREDS_JSON not set!")
+scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
 
-creds_dict = json.loads(creds_json)
+# The sheet is opened on first use (or by warm_up) so importing this module never waits on Google
+_sheet = None
+_sheet_lock = threading.Lock()
+_sheet_status = {"connected": False, "connect_ms": None, "error": None}
 
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-client = gspread.authorize(creds)
-sheet = client.open("Fish Predictions").sheet1
 
+def get_sheet():
+    """Authorize and open the "Fish Predictions" sheet once, then reuse it."""
+    global _sheet
+    if _sheet is not None:
+        return _sheet
 
-def save_to_sheets(processed_result):
-    """Append each detected fish to Google Sheets, right after header row."""
-    try:
-        current_values = sheet.get_all_values()
-        start_row = len(current_values) + 1  
-
-        coin_used = processed_result.get(
-            "coin_used", {"pixels_per_cm": None, "coin_label": None}
-        )
-
-        coin_label = coin_used.get("coin_label") or "Default"
-        pixels_per_cm = coin_used.get("pixels_per_cm")
-        coin_cofidence = coin_used.get("coin_confidence", 0)
-
-        for fish in processed_result["fish_detected"]:
-            row = [
-                fish.get("id"),
-                fish.get("species"),
-                fish.get("confidence"),
-                fish.get("width_px"),
-                fish.get("height_px"),
-                fish.get("width_cm"),
-                fish.get("height_cm"),
-                fish.get("length_cm"),
-                fish.get("area_cm2"),
-                fish.get("days_before_maturity"),
-                pixels_per_cm,
-                coin_label,
-                coin_cofidence,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            ]
-            sheet.insert_row(row, start_row)
-            start_row += 1  
-
-        logging.info("Successfully saved results to Google Sheets (after header).")
+    with _sheet_lock:
+        if _sheet is None:
+            start = time.perf_counter()
+            try:
+                creds_json = os.getenv("GOOGLE_CREDS_JSON")
+                if not creds_json:
+                    raise Exception("Environment variable GOOGLE_CREDS_JSON not set!")
+
+                creds_dict = json.loads(creds_json)
+                creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+                client = gspread.authorize(creds)
+                _sheet = client.open("Fish Predictions").sheet1
+            except Exception as e:
+                _sheet_status["error"] = str(e)
+                raise
+
+            _sheet_status.update({
+                "connected": True,
+                "connect_ms": round((time.perf_counter() - start) * 1000, 2),
+                "error": None,
+            })
+            logging.info(f"Connected to Google Sheets in {_sheet_status['connect_ms']} ms")
+    return _sheet
+
+
+def _log_warm_up_failure(details):
+    logging.error(f"Google Sheets warm-up failed (attempt {details['tries']}), "
+                  f"retrying in {details['wait']:.0f}s: {_sheet_status['error']}")
+
+
+@backoff.on_exception(backoff.expo, Exception, max_value=SHEETS_WARM_UP_MAX_DELAY, on_backoff=_log_warm_up_failure)
+def _connect_until_ready():
+    get_sheet()
+
+
+def warm_up():
+    """
+    Open the sheet in a background thread so the first upload does not pay for it.
+    A failed connection is retried with exponential backoff until it succeeds.
+    """
+    if SHEETS_EXPORT_ENABLED:
+        threading.Thread(target=_connect_until_ready, name="sheets-warm-up", daemon=True).start()
+
+
+def sheets_status():
+    """Readiness information for the Sheets export."""
+    return {"enabled": SHEETS_EXPORT_ENABLED, **_sheet_status}
+
+
+def build_sheet_rows(processed_result):
+    """Turn a processed prediction into one sheet row per detected fish."""
+    coin_used = processed_result.get(
+        "coin_used", {"pixels_per_cm": None, "coin_label": None}
+    )
+
+    coin_label = coin_used.get("coin_label") or "Default"
+    pixels_per_cm = coin_used.get("pixels_per_cm")
+    coin_cofidence = coin_used.get("coin_confidence", 0)
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = []
+    for fish in processed_result["fish_detected"]:
+        rows.append([
+            fish.get("id"),
+            fish.get("species"),
+            fish.get("confidence"),
+            fish.get("width_px"),
+            fish.get("height_px"),
+            fish.get("width_cm"),
+            fish.get("height_cm"),
+            fish.get("length_cm"),
+            fish.get("area_cm2"),
+            fish.get("days_before_maturity"),
+            pixels_per_cm,
+            coin_label,
+            coin_cofidence,
+            timestamp,
+        ])
+    return rows
+
+
+@backoff.on_exception(backoff.expo, Exception, max_tries=SHEETS_MAX_RETRIES, max_value=30)
+def append_rows_to_sheet(rows):
+    """Append rows to the sheet in a single API call, retrying with exponential backoff."""
+    get_sheet().append_rows(rows)
 
+
+_STOP = object()
+
+
+class SheetsWriter:
+    """
+    Background write-behind queue for Google Sheets.
+
+    Rows from many requests are collected from a bounded queue and written
+    with one append_rows call once batch_size rows are pending or
+    flush_interval seconds have passed since the first pending row.
+    """
+
+    def __init__(self, max_queue=SHEETS_QUEUE_SIZE, batch_size=SHEETS_BATCH_SIZE,
+                 flush_interval=SHEETS_FLUSH_INTERVAL):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sheets-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, rows):
+        """Queue rows without blocking. Returns False if the queue is full."""
+        if not rows:
+            return True
+        self.start()
+        try:
+            self.queue.put_nowait(rows)
+            return True
+        except queue.Full:
+            STAGE_ERRORS.inc(stage="sheets_queue")
+            logging.error(f"Sheets write queue full, dropping {len(rows)} rows")
+            return False
+
+    def stop(self, timeout=30):
+        """Flush pending rows and stop the writer thread."""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while True:
+            timeout = self.flush_interval if not pending else max(0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(pending)
+                return
+
+            if item is not None:
+                if not pending:
+                    deadline = time.monotonic() + self.flush_interval
+                pending.extend(item)
+
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(pending)
+                pending = []
+
+    def _write(self, rows):
+        if not rows:
+            return
+        try:
+            with STAGE_LATENCY.time(stage="sheets_write"):
+                append_rows_to_sheet(rows)
+            logging.info(f"Successfully saved {len(rows)} rows to Google Sheets.")
+        except Exception as e:
+            STAGE_ERRORS.inc(stage="sheets_write")
+            logging.error(f"Failed to save {len(rows)} rows to Google Sheets: {e}")
+
+
+sheets_writer = SheetsWriter()
+SHEETS_QUEUE_DEPTH.set_function(sheets_writer.queue.qsize)
+
+
+def save_to_sheets(processed_result, deadline=None):
+    """
+    Queue each detected fish for the background Google Sheets writer.
+    Requests already past their deadline are not queued.
+    """
+    if not SHEETS_EXPORT_ENABLED:
+        return
+    if deadline is not None and deadline.expired():
+        STAGE_ERRORS.inc(stage="sheets_queue")
+        logging.warning("Request deadline passed, not queueing results for Google Sheets")
+        return
+    try:
+        sheets_writer.submit(build_sheet_rows(processed_result))
     except Exception as e:
-        logging.error(f"Failed to save to Google Sheets: {e}")
+        logging.error(f"Failed to queue results for Google Sheets: {e}")
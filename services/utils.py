@@ -64,44 +64,229 @@ def calculate_pixels_per_cm(coin_prediction, coin_label, coin_confidence):
     }
 
 import os
-from inference_sdk import InferenceHTTPClient, InferenceConfiguration
+import asyncio
+import cv2
+import numpy as np
 from services.config import CLASS_CONF_THRESHOLDS
+from services.config import INFERENCE_CACHE_MAX_ENTRIES, INFERENCE_CACHE_TTL, INFERENCE_CACHE_MAX_DISK_ENTRIES
+from services.config import INFERENCE_INPUT_SIZE, INFERENCE_JPEG_QUALITY
+from services.cache import InferenceCache, make_cache_key
+from services.backends import get_inference_backend, get_inference_client
+from services.admission import admission, Overloaded, DeadlineExceeded
+from services.resilience import get_endpoint
 
-def run_inference(image_file, api_key_env, model_id_env, threshold=0.10):
-    """Generic inference runner for Roboflow models using InferenceConfiguration."""
+
+def decode_image(image_bytes):
+    """Decode encoded image bytes to a BGR array, or None if they are not a readable image."""
+    if not image_bytes:
+        return None  # imdecode raises on an empty buffer
     try:
-        api_key = os.getenv(api_key_env)
-        model_id = os.getenv(model_id_env)
-
-        if not api_key:
-            return {"error": f"Walang Key. Check Sa Environment File: {api_key_env}"}
-        if not os.path.exists(image_file):
-            return {"error": f"Check Test_Images: {image_file}"}
-        if not model_id:
-            return {"error": f"Walang Model ID. Check Sa Environment File: {model_id_env}"}
-
-        config = InferenceConfiguration(confidence_threshold=threshold)
-        client = InferenceHTTPClient(
-            api_url="https://detect.roboflow.com",
-            api_key=api_key
-        )
+        return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error as e:
+        logging.warning(f"Could not decode image: {e}")
+        return None
+
+
+def downscale_image(image_bytes, max_size=INFERENCE_INPUT_SIZE, quality=INFERENCE_JPEG_QUALITY, image=None):
+    """
+    Resize an encoded image so its longest side is at most max_size and re-encode as JPEG.
+    Pass the already decoded image_bytes as image to skip decoding them again.
+
+    :return: Tuple of (payload_bytes, scale_x, scale_y, width, height) where the scales map
+             payload pixels back to original pixels and width/height are the original size.
+             If the image is already small enough, or cannot be decoded, the original
+             bytes are returned with a scale of 1.
+    """
+    if image is None:
+        image = decode_image(image_bytes)
+    if image is None:
+        logging.warning("Could not decode image for downscaling, sending original bytes")
+        return image_bytes, 1.0, 1.0, None, None
+
+    height, width = image.shape[:2]
+    if max(width, height) <= max_size:
+        return image_bytes, 1.0, 1.0, width, height
+
+    ratio = max_size / max(width, height)
+    new_width = max(1, round(width * ratio))
+    new_height = max(1, round(height * ratio))
+    resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        logging.warning("Could not re-encode downscaled image, sending original bytes")
+        return image_bytes, 1.0, 1.0, width, height
+
+    logging.info(f"Downscaled image {width}x{height} -> {new_width}x{new_height} ({len(image_bytes)} -> {len(encoded)} bytes)")
+    return encoded.tobytes(), width / new_width, height / new_height, width, height
+
+
+class InferenceImage:
+    """
+    An upload prepared once for every model call.
 
-        with client.use_configuration(config):
-            result = client.infer(image_file, model_id=model_id)
+    Holds the original bytes (used for cache keys) and the downscaled payload
+    that is actually sent, plus the factors to map boxes back to original pixels.
+    """
 
-        if "predictions" not in result:
-            return {"Error": "Walang Prediction"}
+    def __init__(self, image_bytes, decoded=None):
+        self.original = image_bytes
+        self.payload, self.scale_x, self.scale_y, self.width, self.height = downscale_image(image_bytes, image=decoded)
 
-        filtered_predictions = []
-        for pred in result["predictions"]:
-            class_name = str(pred.get("class", "")).upper()
-            conf_threshold = CLASS_CONF_THRESHOLDS.get(class_name, threshold)
 
-            logging.info(f"Class: {class_name}, Confidence: {pred.get('confidence', 0):.2f}, Threshold: {conf_threshold} ")
-            if pred.get("confidence", 0) >= conf_threshold:
-                filtered_predictions.append(pred)
+def prepare_inference_image(image, decoded=None):
+    """
+    Return an InferenceImage from an InferenceImage, encoded bytes or a file path.
+    decoded is the image already decoded by the caller (e.g. the quality gate), if any.
+    """
+    if isinstance(image, InferenceImage):
+        return image
+    if isinstance(image, (bytes, bytearray)):
+        return InferenceImage(bytes(image), decoded)
+    with open(image, "rb") as f:
+        return InferenceImage(f.read())
 
-        result["predictions"] = filtered_predictions
+
+def rescale_predictions(result, prepared):
+    """Map box coordinates from the downscaled payload back to the original image."""
+    if prepared.scale_x == 1.0 and prepared.scale_y == 1.0:
         return result
+
+    for pred in result.get("predictions", []):
+        for key, scale in (("x", prepared.scale_x), ("width", prepared.scale_x),
+                           ("y", prepared.scale_y), ("height", prepared.scale_y)):
+            if key in pred:
+                pred[key] = pred[key] * scale
+
+    if isinstance(result.get("image"), dict):
+        result["image"]["width"] = prepared.width
+        result["image"]["height"] = prepared.height
+    return result
+
+
+# Results keyed by image content, so retried uploads of the same photo skip the remote call
+inference_cache = InferenceCache(
+    max_entries=INFERENCE_CACHE_MAX_ENTRIES,
+    ttl_seconds=INFERENCE_CACHE_TTL,
+    disk_dir=os.getenv("INFERENCE_CACHE_DIR"),
+    max_disk_entries=INFERENCE_CACHE_MAX_DISK_ENTRIES,
+    name="inference",
+)
+
+
+def filter_predictions(predictions, threshold=0.10):
+    """Keep predictions at or above their class threshold (CLASS_CONF_THRESHOLDS, else threshold)."""
+    filtered_predictions = []
+    for pred in predictions:
+        class_name = str(pred.get("class", "")).upper()
+        conf_threshold = CLASS_CONF_THRESHOLDS.get(class_name, threshold)
+
+        logging.debug("Class: %s, Confidence: %.2f, Threshold: %s", class_name, pred.get("confidence", 0), conf_threshold)
+        if pred.get("confidence", 0) >= conf_threshold:
+            filtered_predictions.append(pred)
+    return filtered_predictions
+
+
+def run_inference(image, api_key_env, model_id_env, threshold=0.10, deadline=None):
+    """
+    Generic inference runner for the configured backend (Roboflow or local ONNX).
+
+    image is an InferenceImage, the encoded image bytes (upload path, no disk I/O) or a
+    file path. The downscaled payload is used and boxes are returned in original pixels.
+
+    Calls go through the "inference" admission stage. Remote backends are called through
+    the model's ResilientEndpoint (timeouts, retries, circuit breaker, optional hedging).
+    With a deadline (admission.Deadline) the wait for a slot and the remote attempts are
+    bounded by the time left; running out raises DeadlineExceeded instead of returning
+    an error dict.
+    """
+    try:
+        backend = get_inference_backend()
+
+        error = backend.check(api_key_env, model_id_env)
+        if error:
+            return {"error": error}
+        if isinstance(image, str) and not os.path.exists(image):
+            return {"error": f"Check Test_Images: {image}"}
+
+        prepared = prepare_inference_image(image)
+
+        cache_key = make_cache_key(prepared.original, backend.model_key(model_id_env), threshold)
+        cached = inference_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Inference cache hit for {model_id_env}")
+            return cached
+
+        with admission.limit("inference", deadline):
+            if deadline is not None:
+                deadline.check(f"{model_id_env} inference")
+            if backend.remote:
+                result = get_endpoint(model_id_env).call(
+                    lambda timeout: backend.infer(prepared, api_key_env, model_id_env, threshold, timeout), deadline
+                )
+            else:
+                result = backend.infer(prepared, api_key_env, model_id_env, threshold)
+        return _finish_inference(result, prepared, threshold, cache_key)
+    except (Overloaded, DeadlineExceeded):
+        raise
+    except Exception as e:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded during {model_id_env} inference") from e
+        return {"error": str(e)}
+
+
+async def run_inference_async(image, api_key_env, model_id_env, threshold=0.10, deadline=None):
+    """
+    Awaitable run_inference for the async server, with the same admission stage and deadline.
+
+    The remote call is non-blocking; decoding/downscaling (CPU bound) runs in
+    the loop's executor unless image is already an InferenceImage.
+    """
+    try:
+        backend = get_inference_backend()
+
+        error = backend.check(api_key_env, model_id_env)
+        if error:
+            return {"error": error}
+        if isinstance(image, str) and not os.path.exists(image):
+            return {"error": f"Check Test_Images: {image}"}
+
+        if isinstance(image, InferenceImage):
+            prepared = image
+        else:
+            prepared = await asyncio.get_running_loop().run_in_executor(None, prepare_inference_image, image)
+
+        cache_key = make_cache_key(prepared.original, backend.model_key(model_id_env), threshold)
+        cached = inference_cache.get(cache_key)
+        if cached is not None:
+            logging.info(f"Inference cache hit for {model_id_env}")
+            return cached
+
+        async with admission.limit_async("inference", deadline):
+            if deadline is not None:
+                deadline.check(f"{model_id_env} inference")
+            if backend.remote:
+                result = await get_endpoint(model_id_env).call_async(
+                    lambda timeout: backend.infer_async(prepared, api_key_env, model_id_env, threshold, timeout), deadline
+                )
+            else:
+                result = await backend.infer_async(prepared, api_key_env, model_id_env, threshold)
+        return _finish_inference(result, prepared, threshold, cache_key)
+    except (Overloaded, DeadlineExceeded):
+        raise
     except Exception as e:
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded(f"Deadline exceeded during {model_id_env} inference") from e
         return {"error": str(e)}
+
+
+def _finish_inference(result, prepared, threshold, cache_key):
+    """Rescale, apply class thresholds and cache a raw backend result."""
+    if "predictions" not in result:
+        return {"Error": "Walang Prediction"}
+
+    result = rescale_predictions(result, prepared)
+
+    result["predictions"] = filter_predictions(result["predictions"], threshold)
+    inference_cache.set(cache_key, result)
+    return result
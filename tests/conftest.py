@@ -0,0 +1,17 @@
+# conftest.py
+import os
+import sys
+import tempfile
+
+# Point the app at throwaway paths before any services module reads its environment
+_workdir = tempfile.mkdtemp(prefix="takeafish-tests-")
+os.environ.update({
+    "LOG_FILE": os.path.join(_workdir, "app.log"),
+    "PREDICTIONS_DB_PATH": os.path.join(_workdir, "predictions.db"),
+    "SHEETS_EXPORT": "false",
+    "INFERENCE_BACKEND": "roboflow",
+    "INFERENCE_HEDGING": "false",
+})
+os.environ.pop("INFERENCE_CACHE_DIR", None)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
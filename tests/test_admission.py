@@ -0,0 +1,141 @@
+# test_admission.py
+import asyncio
+import glob
+import io
+import threading
+import aiohttp
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+import asyncserver
+import server
+from benchmarks.standins import InferenceStandin
+from services import utils
+from services.admission import StageLimiter, Overloaded, admission
+from services.cache import InferenceCache
+from services.config import ADMISSION_LIMITS
+
+
+def test_async_waiter_gets_the_released_slot():
+    limiter = StageLimiter("test", max_in_flight=1, max_waiting=1)
+
+    async def run():
+        order = []
+
+        async def worker(name, hold):
+            async with limiter.limit_async(max_wait=5):
+                order.append(name)
+                await asyncio.sleep(hold)
+
+        first = asyncio.ensure_future(worker("first", 0.05))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(worker("second", 0))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await limiter.acquire_async()  # One in flight, one waiting: queue full
+        await asyncio.gather(first, second)
+        return order
+
+    assert asyncio.run(run()) == ["first", "second"]
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_async_wait_times_out_with_overloaded():
+    limiter = StageLimiter("test", max_in_flight=1, max_waiting=1)
+    limiter.acquire()
+
+    with pytest.raises(Overloaded):
+        asyncio.run(limiter.acquire_async(max_wait=0.05))
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+
+def test_slot_released_by_thread_wakes_coroutine():
+    limiter = StageLimiter("test", max_in_flight=1, max_waiting=1)
+    limiter.acquire()
+    threading.Timer(0.05, limiter.release, args=(0.05,)).start()
+
+    asyncio.run(limiter.acquire_async(max_wait=5))
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    standin = InferenceStandin(latency_ms=0, jitter_ms=0).start()
+    monkeypatch.setattr(utils, "inference_cache", InferenceCache(max_entries=0))  # Every upload calls the stand-in
+    monkeypatch.setenv("INFERENCE_API_URL", standin.url)
+    for name, value in {"API_KEY": "standin", "MODEL_ID": "standin-fish/1",
+                        "REFERENCE_API_KEY": "standin", "COIN_MODEL_ID": "standin-coin/1"}.items():
+        monkeypatch.setenv(name, value)
+    yield standin
+    standin.stop()
+    admission.set_limits(ADMISSION_LIMITS)  # create_app raises them for the async server
+
+
+def async_upload(before=None):
+    """POST a sample image to the async /upload; before() runs once the app is created."""
+    sample = sorted(glob.glob("uploads/*.png"))[0]
+
+    async def upload():
+        app = asyncserver.create_app()
+        if before is not None:
+            before()
+        async with TestClient(TestServer(app)) as client:
+            form = aiohttp.FormData()
+            with open(sample, "rb") as f:
+                form.add_field("image", f.read(), filename="sample.png", content_type="image/png")
+            response = await client.post("/upload", data=form)
+            return response.status, response.headers, await response.json()
+
+    return asyncio.run(upload())
+
+
+def test_async_upload_succeeds(standin):
+    status, _, body = async_upload()
+    assert status == 200, body
+    assert body["fish_detected"]
+
+
+@pytest.mark.parametrize("stage", ["upload", "inference", "storage"])
+def test_async_upload_full_stage_is_429(monkeypatch, standin, stage):
+    full = StageLimiter(stage, max_in_flight=1, max_waiting=0)
+    full.acquire()
+    status, headers, body = async_upload(lambda: monkeypatch.setitem(admission.stages, stage, full))
+    assert status == 429, body
+    assert "Retry-After" in headers
+
+
+def test_async_upload_past_deadline_is_504(monkeypatch, standin):
+    standin.latency_ms = 500
+    monkeypatch.setattr(asyncserver, "UPLOAD_DEADLINE_SECONDS", 0.1)
+    status, _, body = async_upload()
+    assert status == 504, body
+
+
+def batch_upload(count=2):
+    """POST count copies of a sample image to /upload/batch on the waitress app."""
+    with open(sorted(glob.glob("uploads/*.png"))[0], "rb") as f:
+        image = f.read()
+    data = {"images": [(io.BytesIO(image), f"fish{i}.png") for i in range(count)]}
+    response = server.app.test_client().post("/upload/batch", data=data, content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["results"]
+
+
+def test_batch_upload_succeeds(standin):
+    results = batch_upload()
+    assert [item["status"] for item in results] == [200, 200], results
+
+
+@pytest.mark.parametrize("stage", ["upload", "inference", "storage"])
+def test_batch_image_in_full_stage_is_429(monkeypatch, standin, stage):
+    full = StageLimiter(stage, max_in_flight=1, max_waiting=0)
+    full.acquire()
+    monkeypatch.setitem(admission.stages, stage, full)
+    for item in batch_upload():
+        assert item["status"] == 429, item
+        assert item["result"]["retry_after"] > 0
+
+
+def test_batch_image_past_deadline_is_504(monkeypatch, standin):
+    standin.latency_ms = 500
+    monkeypatch.setattr(server, "UPLOAD_DEADLINE_SECONDS", 0.1)
+    assert [item["status"] for item in batch_upload()] == [504, 504]
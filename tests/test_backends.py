@@ -0,0 +1,122 @@
+# test_backends.py
+import socket
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+import requests
+from benchmarks.standins import InferenceStandin
+from services.backends import PooledInferenceClient, get_inference_client
+from services.utils import run_inference
+
+API_KEY = "SECRETKEY123456"
+
+
+@pytest.fixture
+def failing_standin():
+    standin = InferenceStandin(latency_ms=0, jitter_ms=0, error_rate=1.0).start()
+    yield standin
+    standin.stop()
+
+
+def closed_port_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def image_bytes():
+    return cv2.imencode(".png", np.full((64, 64, 3), 128, dtype=np.uint8))[1].tobytes()
+
+
+def test_http_error_does_not_contain_api_key(failing_standin):
+    client = PooledInferenceClient(failing_standin.url, API_KEY, "standin-fish/1", 0.1)
+    with pytest.raises(requests.HTTPError) as raised:
+        client.infer(b"image")
+    assert raised.value.response.status_code == 500
+    assert API_KEY not in str(raised.value)
+
+
+def test_connection_error_does_not_contain_api_key():
+    client = PooledInferenceClient(closed_port_url(), API_KEY, "standin-fish/1", 0.1)
+    with pytest.raises(requests.ConnectionError) as raised:
+        client.infer(b"image", timeout=5)
+    assert API_KEY not in str(raised.value)
+
+
+@pytest.mark.parametrize("url", ["standin", "closed"])
+def test_run_inference_error_does_not_contain_api_key(monkeypatch, failing_standin, url):
+    model_id_env = f"KEY_TEST_{url.upper()}_MODEL_ID"
+    monkeypatch.setenv("INFERENCE_API_URL", failing_standin.url if url == "standin" else closed_port_url())
+    monkeypatch.setenv("KEY_TEST_API_KEY", API_KEY)
+    monkeypatch.setenv(model_id_env, "standin-fish/1")
+
+    result = run_inference(image_bytes(), "KEY_TEST_API_KEY", model_id_env)
+    assert "error" in result
+    assert API_KEY not in result["error"]
+
+
+def test_async_http_error_does_not_contain_api_key(failing_standin):
+    import asyncio
+    import aiohttp
+    from services.backends import AsyncInferenceClient
+
+    async def infer():
+        client = AsyncInferenceClient(failing_standin.url, API_KEY, "standin-fish/1", 0.1)
+        try:
+            await client.infer(b"image")
+        finally:
+            await client.close()
+
+    with pytest.raises(aiohttp.ClientResponseError) as raised:
+        asyncio.run(infer())
+    assert raised.value.status == 500
+    assert API_KEY not in str(raised.value)
+
+
+def test_run_inference_async_error_does_not_contain_api_key(monkeypatch, failing_standin):
+    import asyncio
+    from services.backends import close_async_inference_clients
+    from services.utils import run_inference_async
+
+    monkeypatch.setenv("INFERENCE_API_URL", failing_standin.url)
+    monkeypatch.setenv("KEY_TEST_API_KEY", API_KEY)
+    monkeypatch.setenv("KEY_TEST_ASYNC_MODEL_ID", "standin-fish/1")
+
+    async def infer():
+        try:
+            return await run_inference_async(image_bytes(), "KEY_TEST_API_KEY", "KEY_TEST_ASYNC_MODEL_ID")
+        finally:
+            await close_async_inference_clients()
+
+    result = asyncio.run(infer())
+    assert "error" in result
+    assert API_KEY not in result["error"]
+
+
+def test_rotated_client_is_closed_after_its_request_finishes(monkeypatch):
+    standin = InferenceStandin(latency_ms=300, jitter_ms=0).start()
+    monkeypatch.setenv("INFERENCE_API_URL", standin.url)
+    monkeypatch.setenv("ROTATE_TEST_API_KEY", "old-key")
+    monkeypatch.setenv("ROTATE_TEST_MODEL_ID", "standin-fish/1")
+    try:
+        old = get_inference_client("ROTATE_TEST_API_KEY", "ROTATE_TEST_MODEL_ID")
+        closed = threading.Event()
+        monkeypatch.setattr(old, "close", closed.set)
+        results = []
+        request = threading.Thread(target=lambda: results.append(old.infer(b"image", timeout=5)))
+        request.start()
+        while old._in_flight == 0:
+            time.sleep(0.001)
+
+        monkeypatch.setenv("ROTATE_TEST_API_KEY", "new-key")
+        new = get_inference_client("ROTATE_TEST_API_KEY", "ROTATE_TEST_MODEL_ID")
+        assert new is not old and new.api_key == "new-key"
+        assert not closed.is_set()  # The request in flight keeps its session
+
+        request.join()
+        assert results and "predictions" in results[0]
+        assert closed.is_set()
+    finally:
+        standin.stop()
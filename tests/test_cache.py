@@ -0,0 +1,66 @@
+# test_cache.py
+import os
+import time
+
+from services.cache import InferenceCache
+from services.metrics import render_metrics
+
+
+def test_named_cache_exports_lookups_and_entries(tmp_path):
+    cache = InferenceCache(max_entries=4, disk_dir=str(tmp_path), name="test")
+    cache.set("a", {"predictions": []})
+    assert cache.get("a") == {"predictions": []}
+    assert cache.get("b") is None
+
+    metrics = render_metrics()
+    assert 'takeafish_cache_lookups_total{cache="test",result="hit"} 1' in metrics
+    assert 'takeafish_cache_lookups_total{cache="test",result="miss"} 1' in metrics
+    assert 'takeafish_cache_entries{cache="test",tier="memory"} 1' in metrics
+    assert 'takeafish_cache_entries{cache="test",tier="disk"} 1' in metrics
+
+
+def test_disk_hit_is_counted(tmp_path):
+    InferenceCache(disk_dir=str(tmp_path)).set("a", {"n": 1})
+    cache = InferenceCache(disk_dir=str(tmp_path), name="test_disk")
+    assert cache.get("a") == {"n": 1}
+    assert 'takeafish_cache_lookups_total{cache="test_disk",result="disk_hit"} 1' in render_metrics()
+
+
+def test_disk_tier_is_pruned_to_the_cap(tmp_path):
+    cache = InferenceCache(max_entries=1, disk_dir=str(tmp_path), max_disk_entries=10)
+    for i in range(25):
+        path = os.path.join(str(tmp_path), f"{i}.json")
+        cache.set(str(i), {"n": i})
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    files = [name for name in os.listdir(str(tmp_path)) if name.endswith(".json")]
+    assert len(files) <= 10
+    assert cache.stats()["disk_entries"] == len(files)
+    # The newest entries are kept
+    assert "24.json" in files
+    assert "0.json" not in files
+
+
+def test_expired_disk_entries_are_pruned_on_start(tmp_path):
+    cache = InferenceCache(disk_dir=str(tmp_path), ttl_seconds=60)
+    cache.set("old", {"n": 0})
+    cache.set("new", {"n": 1})
+    old_path = os.path.join(str(tmp_path), "old.json")
+    os.utime(old_path, (time.time() - 120, time.time() - 120))
+
+    reopened = InferenceCache(disk_dir=str(tmp_path), ttl_seconds=60)
+    assert not os.path.exists(old_path)
+    assert reopened.stats()["disk_entries"] == 1
+    assert reopened.get("new") == {"n": 1}
+
+
+def test_delete_of_expired_entry_reports_not_found():
+    cache = InferenceCache(ttl_seconds=60)
+    cache.set("fresh", {"n": 1})
+    cache.set("old", {"n": 0})
+    stored_at, value = cache._entries["old"]
+    cache._entries["old"] = (stored_at - 120, value)
+
+    assert cache.delete("fresh") is True
+    assert cache.delete("old") is False
+    assert cache.delete("missing") is False
@@ -0,0 +1,120 @@
+# test_dailyreport.py
+import csv
+import gzip
+import io
+import smtplib
+import zipfile
+from datetime import datetime
+import pytest
+from services import dailyreport
+from services.dailyreport import build_csv_attachment, REPORT_HEADERS
+
+ROWS = [
+    {"INTERFERENCE ID": f"det-{i}", "Species": "TILAPIA" if i % 2 else "LAPU-LAPU", "Confidence": 0.9,
+     "Width (px)": 260.5, "Height (px)": 110, "Width (cm)": 13.02, "Height (cm)": 5.5, "Length (cm)": 13.02,
+     "Area (cm²)": 71.61, "Days Before Maturity": i, "Pixels per cm": 20.0,
+     "Coin Label": "1_PESO" if i % 3 else "", "Coin Confidence": 0.95, "Date/Time": "2026-10-17 08:00:00"}
+    for i in range(500)
+]
+ROWS.append({"INTERFERENCE ID": 'quoted "id", with comma', "Species": "ISLAND MACKEREL\nline two"})
+
+
+def legacy_csv(recent_data, path):
+    """The CSV written by the former build_csv_file, before the attachment was built in memory."""
+    headers = ["INTERFERENCE ID", "Species", "Confidence", "Width (px)", "Height (px)",
+               "Width (cm)", "Height (cm)", "Length (cm)", "Area (cm²)",
+               "Days Before Maturity", "Pixels per cm", "Coin Label", "Coin Confidence", "Date/Time"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        for row in recent_data:
+            writer.writerow({header: row.get(header, "") for header in headers})
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def decompress(filename, data):
+    if filename.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            (name,) = archive.namelist()
+            assert filename == f"{name}.zip"
+            return archive.read(name)
+    if filename.endswith(".gz"):
+        return gzip.decompress(data)
+    return data
+
+
+def test_default_attachment_is_plain_csv():
+    filename, data = build_csv_attachment(ROWS)
+    assert filename.endswith(".csv")
+
+
+@pytest.mark.parametrize("compression", ["none", "zip", "gzip"])
+def test_attachment_is_byte_compatible_with_legacy_csv(tmp_path, compression):
+    filename, data = build_csv_attachment(ROWS, compression)
+    assert decompress(filename, data) == legacy_csv(ROWS, tmp_path / "legacy.csv")
+
+
+class FakeSheet:
+    def __init__(self, rows):
+        self.values = [list(REPORT_HEADERS)] + rows
+        self.cleared = False
+
+    def get_all_values(self):
+        return [list(row) for row in self.values]
+
+    def clear(self):
+        self.cleared = True
+        self.values = []
+
+    def append_row(self, row):
+        self.values.append(list(row))
+
+
+class FakeSMTP:
+    def __init__(self, *args, fail=False):
+        self.fail = fail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def login(self, *args):
+        if self.fail:
+            raise smtplib.SMTPAuthenticationError(535, b"rejected")
+
+    def sendmail(self, sender, recipient, message):
+        pass
+
+
+def sheet_row(detection_id, date_time):
+    row = [""] * len(REPORT_HEADERS)
+    row[0], row[1], row[-1] = detection_id, "TILAPIA", date_time
+    return row
+
+
+def test_recent_data_matches_get_all_records_and_skips_invalid_dates(monkeypatch):
+    now = datetime.now().strftime(dailyreport.DATE_FORMAT)
+    sheet = FakeSheet([sheet_row("det-1", now), sheet_row("det-2", "2000-01-01 00:00:00"),
+                       sheet_row("det-3", "not a date"), ["det-4"]])
+    monkeypatch.setattr(dailyreport, "get_sheet", lambda: sheet)
+
+    recent = dailyreport.get_recent_data()
+    assert [row["INTERFERENCE ID"] for row in recent] == ["det-1"]
+    assert recent[0]["Date/Time"] == now
+    assert recent[0]["Confidence"] == ""
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_sheet_is_cleared_only_after_the_email_was_sent(monkeypatch, fail):
+    now = datetime.now().strftime(dailyreport.DATE_FORMAT)
+    sheet = FakeSheet([sheet_row("det-1", now)])
+    monkeypatch.setattr(dailyreport, "get_sheet", lambda: sheet)
+    monkeypatch.setattr(smtplib, "SMTP_SSL", lambda *args: FakeSMTP(fail=fail))
+
+    dailyreport.send_report()
+    assert sheet.cleared is not fail
+    assert sheet.values[0] == REPORT_HEADERS
+    assert len(sheet.values) == (1 if not fail else 2)
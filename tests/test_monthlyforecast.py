@@ -0,0 +1,21 @@
+# test_monthlyforecast.py
+import pytest
+
+from services.config import GROWTH_CONSTANTS, GROWTH_PARAMETERS, MATURITY_THRESHOLD
+from services.monthlyforecast import FORECAST_CONSTANTS, calculate_age_from_length
+
+
+def test_forecast_constants_follow_growth_constants():
+    assert set(FORECAST_CONSTANTS) == set(GROWTH_CONSTANTS)
+    for species, (L_inf, K, t0, maturity_length, maturity_age_years) in FORECAST_CONSTANTS.items():
+        constants = GROWTH_CONSTANTS[species]
+        assert (L_inf, K, t0, maturity_length) == (
+            constants["L_inf"], constants["K"], constants["t0"], constants["maturity_length"])
+        assert maturity_age_years * 365 == pytest.approx(constants["maturity_age_days"])
+
+
+def test_maturity_age_matches_reverse_von_bertalanffy():
+    for species, params in GROWTH_PARAMETERS.items():
+        maturity_length = params["L_inf"] * MATURITY_THRESHOLD
+        expected = calculate_age_from_length(maturity_length, params["L_inf"], params["K"], params["t0"])
+        assert FORECAST_CONSTANTS[species][4] == pytest.approx(expected)
@@ -0,0 +1,57 @@
+# test_predictionstore.py
+import sqlite3
+import pytest
+from services.admission import Deadline, DeadlineExceeded
+from services.predictionstore import build_query, get_connection, query_predictions, save_prediction
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "predictions.db")
+    for species in ["TILAPIA", "BANGUS"] * 30:
+        save_prediction({
+            "coin_used": {"coin_label": "1_PESO", "pixels_per_cm": 20.0},
+            "fish_detected": [{"id": species.lower(), "species": species, "length_cm": 12.0}],
+        }, db_path=path)
+    return path
+
+
+@pytest.mark.parametrize("filters", [
+    {"species": "TILAPIA"},
+    {"species": "TILAPIA", "cursor": 40},
+    {"coin_label": "1_PESO"},
+    {"species": "TILAPIA", "start": "2020-01-01"},
+])
+def test_filtered_pages_are_read_in_index_order(db_path, filters):
+    sql, params = build_query(**filters)
+    plan = " | ".join(row[3] for row in get_connection(db_path).execute(f"EXPLAIN QUERY PLAN {sql}", params))
+    assert "USING INDEX idx_predictions_" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_query_pages_through_filtered_results(db_path):
+    first = query_predictions(species="tilapia", limit=20, db_path=db_path)
+    second = query_predictions(species="tilapia", limit=20, cursor=first["next_cursor"], db_path=db_path)
+    ids = [row["id"] for row in first["predictions"] + second["predictions"]]
+    assert len(ids) == 30 and ids == sorted(ids, reverse=True)
+    assert second["next_cursor"] is None
+    assert {row["species"] for row in first["predictions"] + second["predictions"]} == {"TILAPIA"}
+
+
+RESULT = {"coin_used": {}, "fish_detected": [{"id": "late", "species": "TILAPIA"}]}
+
+
+def test_save_past_deadline_raises(db_path):
+    with pytest.raises(DeadlineExceeded):
+        save_prediction(RESULT, db_path=db_path, deadline=Deadline(0))
+
+
+def test_save_on_locked_database_raises_once_the_deadline_passes(db_path):
+    lock = sqlite3.connect(db_path)
+    lock.execute("BEGIN EXCLUSIVE")
+    try:
+        with pytest.raises(DeadlineExceeded):
+            save_prediction(RESULT, db_path=db_path, deadline=Deadline(0.2))
+    finally:
+        lock.rollback()
+        lock.close()
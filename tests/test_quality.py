@@ -0,0 +1,49 @@
+# test_quality.py
+import io
+import pytest
+import server
+from services.utils import decode_image
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def test_decode_image_returns_none_for_unreadable_bytes():
+    assert decode_image(b"") is None
+    assert decode_image(b"not an image") is None
+
+
+def test_empty_upload_is_rejected_as_undecodable(client):
+    response = client.post("/upload", data={"image": (io.BytesIO(b""), "empty.jpg")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 422
+    assert response.get_json()["image_quality"]["issues"] == ["undecodable"]
+
+
+def test_empty_file_in_batch_is_a_per_item_rejection(client):
+    images = [(io.BytesIO(b""), "empty.jpg"), (io.BytesIO(b"\x00" * 10), "corrupt.png")]
+    response = client.post("/upload/batch", data={"images": images}, content_type="multipart/form-data")
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [item["status"] for item in results] == [422, 422]
+    assert all(item["result"]["image_quality"]["issues"] == ["undecodable"] for item in results)
+
+
+def test_empty_upload_is_rejected_by_async_server():
+    import asyncio
+    import aiohttp
+    from aiohttp.test_utils import TestClient, TestServer
+    import asyncserver
+
+    async def upload():
+        async with TestClient(TestServer(asyncserver.create_app())) as async_client:
+            form = aiohttp.FormData()
+            form.add_field("image", b"", filename="empty.jpg", content_type="image/jpeg")
+            response = await async_client.post("/upload", data=form)
+            return response.status, await response.json()
+
+    status, body = asyncio.run(upload())
+    assert status == 422
+    assert body["image_quality"]["issues"] == ["undecodable"]
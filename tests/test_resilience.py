@@ -0,0 +1,61 @@
+# test_resilience.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from services import resilience
+from services.resilience import ResilientEndpoint
+
+
+@pytest.mark.parametrize("hang", ["queued", "running"])
+def test_hedged_call_is_bounded_by_its_timeout(monkeypatch, hang):
+    release = threading.Event()
+    if hang == "queued":
+        executor = ThreadPoolExecutor(max_workers=1)
+        executor.submit(release.wait)  # Saturated: the attempts never start
+    else:
+        executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(resilience, "HEDGE_EXECUTOR", executor)
+    endpoint = ResilientEndpoint("test-hedge-timeout", hedging=True)
+
+    start = time.monotonic()
+    try:
+        with pytest.raises(requests.Timeout):
+            endpoint._hedged(lambda timeout: release.wait(), timeout=0.2, delay=0.05)
+        assert time.monotonic() - start < 1
+    finally:
+        release.set()
+        executor.shutdown()
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def test_non_transient_error_does_not_close_half_open_circuit():
+    endpoint = ResilientEndpoint("test-breaker")
+    breaker = endpoint.breaker
+    breaker.state, breaker.opened_at = breaker.OPEN, time.monotonic() - breaker.reset_timeout
+
+    def bad_request(timeout):
+        raise http_error(400)
+
+    with pytest.raises(requests.HTTPError):
+        endpoint._timed(bad_request, 1)
+    assert breaker.state == breaker.HALF_OPEN
+
+    endpoint._timed(lambda timeout: {"predictions": []}, 1)  # The next probe is let through
+    assert breaker.state == breaker.CLOSED
+
+
+def test_non_transient_errors_do_not_reset_the_failure_count():
+    endpoint = ResilientEndpoint("test-breaker-count")
+    for error in [http_error(503), http_error(400), http_error(503)]:
+        def fail(timeout, error=error):
+            raise error
+        with pytest.raises(requests.HTTPError):
+            endpoint._timed(fail, 1)
+    assert endpoint.breaker.failures == 2
@@ -0,0 +1,81 @@
+# test_server.py
+import io
+import time
+import pytest
+import server
+from services import storage
+from werkzeug.test import EnvironBuilder
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, "MAX_FILE_SIZE", 1000)  # 20 KB batch limit
+    parsed = []
+    original = server.UploadRequest._get_file_stream
+
+    def spy(self, *args, **kwargs):
+        parsed.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(server.UploadRequest, "_get_file_stream", spy)
+    client = server.app.test_client()
+    client.parsed = parsed
+    return client
+
+
+def batch_body(size):
+    builder = EnvironBuilder(method="POST", data={"images": [(io.BytesIO(b"\x00" * size), "big.png")]})
+    return builder.get_request().get_data(), builder.content_type
+
+
+def test_oversized_batch_is_rejected_before_parsing(client):
+    body, content_type = batch_body(30000)
+    response = client.post("/upload/batch", data=body, content_type=content_type)
+    assert response.status_code == 400
+    assert "Batch size exceeds" in response.get_json()["error"]
+    assert client.parsed == []
+
+
+def test_oversized_chunked_batch_stops_at_the_limit(client):
+    body, content_type = batch_body(30000)
+    environ = EnvironBuilder("/upload/batch", method="POST", input_stream=io.BytesIO(body),
+                             content_type=content_type).get_environ()
+    del environ["CONTENT_LENGTH"]  # Chunked: the server only knows the stream ends
+    environ["wsgi.input_terminated"] = True
+    response = client.open(environ)
+    assert response.status_code == 400
+    assert "Batch size exceeds" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("connected, error, status, http_status", [
+    (True, None, "ready", 200),
+    (False, None, "starting", 503),
+    (False, "invalid_grant", "degraded", 200),
+])
+def test_readiness_reports_sheets_state(monkeypatch, connected, error, status, http_status):
+    monkeypatch.setattr(storage, "SHEETS_EXPORT_ENABLED", True)
+    monkeypatch.setattr(storage, "_sheet_status", {"connected": connected, "connect_ms": None, "error": error})
+    response = server.app.test_client().get("/ready")
+    assert response.status_code == http_status
+    assert response.get_json()["status"] == status
+
+
+def test_warm_up_retries_until_the_sheet_connects(monkeypatch):
+    attempts = []
+
+    def get_sheet():
+        attempts.append(1)
+        if len(attempts) == 1:
+            storage._sheet_status["error"] = "temporary failure"
+            raise ConnectionError("temporary failure")
+        storage._sheet_status.update({"connected": True, "error": None})
+
+    monkeypatch.setattr(storage, "SHEETS_EXPORT_ENABLED", True)
+    monkeypatch.setattr(storage, "_sheet_status", {"connected": False, "connect_ms": None, "error": None})
+    monkeypatch.setattr(storage, "get_sheet", get_sheet)
+    storage.warm_up()
+    deadline = time.monotonic() + 5
+    while not storage.sheets_status()["connected"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert len(attempts) == 2
+    assert server.readiness()[:2] == ("ready", 200)
@@ -0,0 +1,53 @@
+# test_shutdown.py
+import json
+import os
+import signal
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Queue rows for the Sheets writer, then serve until SIGTERM as server.py / asyncserver.py do
+SERVE = """
+import sys
+from benchmarks.standins import SheetStandin
+import server
+from services import storage
+
+storage._sheet = SheetStandin(0, 0)
+storage.save_to_sheets({"fish_detected": [{"id": "a"}, {"id": "b"}, {"id": "c"}]})
+if sys.argv[1] == "aiohttp":
+    from aiohttp import web
+    import asyncserver
+
+    async def ready(app):
+        print("ready", flush=True)
+
+    app = asyncserver.create_app()
+    app.on_startup.append(ready)
+    web.run_app(app, host="127.0.0.1", port=0, print=None)
+else:
+    from waitress import serve
+    server.exit_on_sigterm()
+    print("ready", flush=True)
+    serve(server.app, host="127.0.0.1", port=0)
+"""
+
+
+@pytest.mark.parametrize("mode", ["waitress", "aiohttp"])
+def test_sigterm_flushes_queued_sheet_rows(tmp_path, mode):
+    log_file = tmp_path / "app.log"
+    env = {**os.environ, "LOG_FILE": str(log_file), "SHEETS_EXPORT": "true",
+           "PREDICTIONS_DB_PATH": str(tmp_path / "predictions.db")}
+    process = subprocess.Popen([sys.executable, "-c", SERVE, mode], cwd=ROOT, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == "ready"
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0, process.stderr.read()
+    finally:
+        process.kill()
+
+    messages = [json.loads(line)["message"] for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert "Successfully saved 3 rows to Google Sheets." in messages
@@ -0,0 +1,74 @@
+# test_species.py
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from services import species
+from services.admission import Deadline, DeadlineExceeded, Overloaded
+from services.config import ADMISSION_LIMITS, ADMISSION_MAX_WAITING
+
+
+def test_inference_executor_covers_the_inference_stage():
+    assert species.INFERENCE_EXECUTOR._max_workers == ADMISSION_LIMITS["inference"] + ADMISSION_MAX_WAITING
+
+
+@pytest.mark.parametrize("error", [DeadlineExceeded("Deadline exceeded"), Overloaded("inference", 1)])
+def test_failed_detection_cancels_pending_coin_call(monkeypatch, error):
+    coin_calls = []
+
+    def failing_fish(image, deadline=None):
+        raise error
+
+    monkeypatch.setattr(species, "predict_fish_specie", failing_fish)
+    monkeypatch.setattr(species, "detect_reference_coin", lambda image, deadline=None: coin_calls.append(image))
+    # One worker, so the coin call is still queued when the fish call fails
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(species, "INFERENCE_EXECUTOR", executor)
+
+    with pytest.raises(type(error)):
+        species.detect_fish_and_coin(b"image", Deadline(30))
+    executor.shutdown(wait=True)
+    assert coin_calls == []
+
+
+SESSION = {
+    "session_id": "session",
+    "calibration": {"coin_label": "1_PESO", "coin_diameter_cm": 2.3, "width_px": 92.0, "pixels_per_cm": 40.0,
+                    "coin_confidence": 0.9, "image_width": 4000, "image_height": 3000},
+}
+
+
+def fish_result(width, height):
+    return {"image": {"width": width, "height": height},
+            "predictions": [{"class": "TILAPIA", "confidence": 0.9, "width": 800, "height": 300, "detection_id": "f"}]}
+
+
+@pytest.mark.parametrize("size, pixels_per_cm", [
+    ((4000, 3000), 40.0),  # Same photo size
+    ((2000, 1500), 20.0),  # Same frame, resized
+    ((3000, 3000), None),  # Other aspect ratio
+    ((None, None), None),  # Unknown size
+])
+def test_session_calibration_follows_the_upload_size(size, pixels_per_cm):
+    coin_result = species.session_coin_result(SESSION, fish_result(*size))
+    if pixels_per_cm is None:
+        assert coin_result is None
+    else:
+        assert coin_result["pixels_per_cm"] == pytest.approx(pixels_per_cm)
+
+
+def test_mismatched_session_falls_back_to_coin_detection(monkeypatch):
+    coin_calls = []
+
+    def detect_coin(image, deadline=None):
+        coin_calls.append(image)
+        return {**SESSION["calibration"], "pixels_per_cm": 30.0}
+
+    monkeypatch.setattr(species, "detect_reference_coin", detect_coin)
+    processed = species.process_prediction(fish_result(3000, 3000), b"image", calibration=SESSION)
+    assert coin_calls == [b"image"]
+    assert "calibration_session" not in processed["coin_used"]
+    assert processed["coin_used"]["pixels_per_cm"] == 30.0
+
+    processed = species.process_prediction(fish_result(2000, 1500), b"image", calibration=SESSION)
+    assert len(coin_calls) == 1
+    assert processed["coin_used"]["calibration_session"] == "session"
+    assert processed["fish_detected"][0]["width_cm"] == pytest.approx(800 / 20.0, rel=0.01)
@@ -0,0 +1,56 @@
+# test_utils.py
+import cv2
+import numpy as np
+import pytest
+from services.config import INFERENCE_INPUT_SIZE
+from services.utils import InferenceImage, calculate_pixels_per_cm, convert_bbox_to_cm, rescale_predictions
+
+LENGTH_TOLERANCE = 0.005  # length_cm from the downscaled payload stays within 0.5% of full resolution
+
+
+def phone_photo(width=4032, height=3024):
+    """A 12MP photo of a dark fish and a 1 peso coin on a light background."""
+    image = np.full((height, width, 3), 225, dtype=np.uint8)
+    cv2.ellipse(image, (1900, 1500), (1150, 330), 0, 0, 360, (60, 70, 80), -1, cv2.LINE_AA)
+    cv2.circle(image, (3500, 2500), 157, (40, 40, 40), -1, cv2.LINE_AA)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+def decode(image_bytes):
+    return cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def detect(image_bytes):
+    """Stand-in model: boxes of the dark blobs in the image it receives, in its pixels."""
+    image = decode(image_bytes)
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    predictions = []
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True)[:2]:
+        x, y, w, h = cv2.boundingRect(contour)
+        predictions.append({"x": x + w / 2, "y": y + h / 2, "width": float(w), "height": float(h), "confidence": 0.9})
+    fish, coin = predictions
+    fish.update({"class": "TILAPIA", "detection_id": "fish"})
+    coin.update({"class": "1_PESO", "class_id": 0})
+    return {"image": {"width": image.shape[1], "height": image.shape[0]}, "predictions": [fish, coin]}
+
+
+def measure(result):
+    fish, coin = result["predictions"]
+    pixels_per_cm = calculate_pixels_per_cm(coin, "1_PESO", coin["confidence"])["pixels_per_cm"]
+    width_cm, height_cm = convert_bbox_to_cm(fish["width"], fish["height"], pixels_per_cm)
+    return {"length_cm": max(width_cm, height_cm), "height_cm": min(width_cm, height_cm)}
+
+
+def test_downscaled_payload_keeps_length_within_tolerance():
+    original = phone_photo()
+    prepared = InferenceImage(original)
+    assert max(decode(prepared.payload).shape[:2]) == INFERENCE_INPUT_SIZE
+    assert len(prepared.payload) < len(original) / 10
+
+    full = measure(detect(original))
+    downscaled = measure(rescale_predictions(detect(prepared.payload), prepared))
+
+    assert downscaled["length_cm"] == pytest.approx(full["length_cm"], rel=LENGTH_TOLERANCE)
+    assert downscaled["height_cm"] == pytest.approx(full["height_cm"], rel=LENGTH_TOLERANCE)